@@ -0,0 +1,48 @@
+"""
+Realistic Spanish messages with the intent JSON the LLM is expected to return
+for each one. Messages marked as voice are replayed as voice notes that
+"transcribe" to the same text.
+"""
+
+def expense(amount, category, description):
+    return {"amount": amount, "category": category, "description": description}
+
+MESSAGES = [
+    # Expenses, several of them simple enough for the fast path.
+    ("gaste 5000 en cafe", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(5000, "salidas", "cafe")]}}, False),
+    ("gaste 12.500 en el super", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(12500, "alimentos", "super")]}}, False),
+    ("pague 30 mil de expensas", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(30000, "expensas", "expensas")]}}, False),
+    ("cargué nafta por 15000 y 3000 de un peaje", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(15000, "auto", "nafta"), expense(3000, "auto", "peaje")]}}, False),
+    ("fui a la verdulería y gasté 8400, después 2500 en la farmacia", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(8400, "alimentos", "verduleria"), expense(2500, "medicamentos", "farmacia")]}}, False),
+    ("me compré una remera de 18000", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(18000, "ropa", "remera")]}}, False),
+    ("le llevé al perro a la veterinaria, 22000", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(22000, "mascotas", "veterinaria")]}}, True),
+    ("hice un gasto de 28000 pesos en medicamento ibupirac", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(28000, "medicamentos", "medicamento ibupirac")]}}, True),
+    ("cena con amigos 45000 y el taxi de vuelta 6000", {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense(45000, "salidas", "cena con amigos"), expense(6000, "auto", "taxi")]}}, True),
+    # Income
+    ("cobre 150000 de mi sueldo", {"intent": "REGISTRAR_INGRESO", "entities": {"amount": 150000, "description": "sueldo"}}, False),
+    ("me pagaron 20000 por el proyecto freelance", {"intent": "REGISTRAR_INGRESO", "entities": {"amount": 20000, "description": "proyecto freelance"}}, True),
+    # Summaries
+    ("resumen de hoy", {"intent": "CONSULTAR_GASTOS", "entities": {"period": "hoy"}}, False),
+    ("resumen del mes pasado", {"intent": "CONSULTAR_GASTOS", "entities": {"period": "mes pasado"}}, False),
+    ("cuanto gaste esta semana", {"intent": "CONSULTAR_GASTOS", "entities": {"period": "esta semana"}}, False),
+    ("decime cuánto gasté en los últimos 15 días", {"intent": "CONSULTAR_GASTOS", "entities": {"period": "últimos 15 días"}}, True),
+    ("balance del año pasado", {"intent": "CONSULTAR_GASTOS", "entities": {"period": "año pasado"}}, False),
+    # Per-category queries
+    ("mostrame los gastos de auto y mascotas del mes pasado", {"intent": "CONSULTAR_GASTOS_POR_CATEGORIA", "entities": {"categories": ["auto", "mascotas"], "period": "mes pasado"}}, False),
+    ("cuales fueron mis gastos en salidas este mes?", {"intent": "CONSULTAR_GASTOS_POR_CATEGORIA", "entities": {"categories": ["salidas"], "period": "este mes"}}, True),
+    # Budgets
+    ("fijar presupuesto de 80000 para ocio", {"intent": "DEFINIR_PRESUPUESTO", "entities": {"category": "ocio", "amount": 80000}}, False),
+    ("cuanto me queda para alimentos", {"intent": "CONSULTAR_PRESUPUESTO", "entities": {"category": "alimentos"}}, False),
+    ("como voy con el presupuesto de salidas", {"intent": "CONSULTAR_PRESUPUESTO", "entities": {"category": "salidas"}}, True),
+    # Categories, help and chatter
+    ("agrega la categoria Gimnasio", {"intent": "AGREGAR_CATEGORIA", "entities": {"category_names": ["Gimnasio"]}}, False),
+    ("ayuda", {"intent": "PEDIR_AYUDA", "entities": {}}, False),
+    ("que podes hacer?", {"intent": "PEDIR_AYUDA", "entities": {}}, False),
+    ("hola, todo bien?", {"intent": "OTRO", "entities": {}}, False),
+]
+
+def answers() -> dict:
+    """
+    Maps each message text to the LLM answer for it.
+    """
+    return {text: answer for text, answer, _ in MESSAGES}
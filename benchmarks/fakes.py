@@ -0,0 +1,287 @@
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import Counter
+from types import SimpleNamespace
+from utils import schemas
+from utils.gsheets_api import SheetsClientManager, DEFAULT_HEADERS
+from utils.rate_limit import SheetsRateLimiter
+
+VOICE_PREFIX = b"OggS-fake:"
+
+class RateLimitError(Exception):
+    """
+    Stand-in for the 429 errors the real clients raise.
+    """
+
+class CallStats:
+    """
+    Thread-safe counters of every call that would have left the process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def count(self, kind: str):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.calls)
+
+class Latency:
+    """
+    Simulated service latency: mean seconds with +-50% jitter, plus the
+    probability that a call fails with a 429.
+    """
+    def __init__(self, mean: float = 0.0, rate_limit_probability: float = 0.0):
+        self.mean = mean
+        self.rate_limit_probability = rate_limit_probability
+
+    def delay(self) -> float:
+        return self.mean * random.uniform(0.5, 1.5) if self.mean else 0.0
+
+    def should_rate_limit(self) -> bool:
+        return random.random() < self.rate_limit_probability
+
+    def wait(self, stats: CallStats, kind: str):
+        stats.count(kind)
+        time.sleep(self.delay())
+        if self.should_rate_limit():
+            stats.count(f"{kind}.429")
+            raise RateLimitError(f"429 Resource has been exhausted ({kind})")
+
+    async def wait_async(self, stats: CallStats, kind: str):
+        stats.count(kind)
+        await asyncio.sleep(self.delay())
+        if self.should_rate_limit():
+            stats.count(f"{kind}.429")
+            raise RateLimitError(f"429 Resource has been exhausted ({kind})")
+
+# --- Google Sheets ---
+
+class FakeWorksheet:
+    """
+    In-memory worksheet implementing the gspread calls gsheets_api makes.
+    """
+    def __init__(self, title: str, rows: list, latency: Latency, stats: CallStats):
+        self.title = title
+        self.rows = rows
+        self.latency = latency
+        self.stats = stats
+        self._lock = threading.Lock()
+
+    def _read(self):
+        self.latency.wait(self.stats, "sheets.read")
+
+    def _write(self):
+        self.latency.wait(self.stats, "sheets.write")
+
+    def get_all_values(self):
+        self._read()
+        with self._lock:
+            return list(self.rows)
+
+    def get(self, range_name: str):
+        self._read()
+        start_row = int(re.match(r"[A-Z]+(\d+)", range_name).group(1))
+        with self._lock:
+            return self.rows[start_row - 1:]
+
+    def get_all_records(self):
+        self._read()
+        with self._lock:
+            headers = self.rows[0] if self.rows else []
+            return [dict(zip(headers, row)) for row in self.rows[1:]]
+
+    def _append_response(self, first_row: int, count: int) -> dict:
+        return {"updates": {"updatedRange": f"{self.title}!A{first_row}:F{first_row + count - 1}", "updatedRows": count}}
+
+    def append_row(self, row: list):
+        return self.append_rows([row])
+
+    def append_rows(self, rows: list):
+        self._write()
+        with self._lock:
+            first_row = len(self.rows) + 1
+            self.rows.extend([str(value) for value in row] for row in rows)
+        return self._append_response(first_row, len(rows))
+
+    def find(self, query: str, in_column: int = None):
+        self._read()
+        with self._lock:
+            for index, row in enumerate(self.rows, start=1):
+                if len(row) >= in_column and row[in_column - 1] == query:
+                    return SimpleNamespace(row=index, col=in_column)
+        return None
+
+    def update_cell(self, row: int, col: int, value):
+        self._write()
+        with self._lock:
+            self.rows[row - 1][col - 1] = str(value)
+
+class FakeSheetsManager(SheetsClientManager):
+    """
+    SheetsClientManager whose worksheets live in memory, so everything above
+    it (quota limiter, retries, caches, ledger, journal) runs unchanged.
+    """
+    def __init__(self, worksheets: dict, latency: Latency, stats: CallStats, limiter: SheetsRateLimiter = None):
+        super().__init__("fake-sheet", "fake-service-account.json", limiter)
+        self.latency = latency
+        self.stats = stats
+        self._fake_worksheets = {
+            title: FakeWorksheet(title, rows, latency, stats) for title, rows in worksheets.items()
+        }
+
+    def client(self):
+        return None
+
+    def worksheet(self, sheet_name: str, create_headers: list = None):
+        with self._lock:
+            worksheet = self._fake_worksheets.get(sheet_name)
+            if worksheet is None:
+                worksheet = FakeWorksheet(sheet_name, [list(create_headers or [])], self.latency, self.stats)
+                self._fake_worksheets[sheet_name] = worksheet
+            return worksheet
+
+CATEGORIES = ["alimentos", "alquiler", "salidas", "expensas", "mascotas", "servicios", "regalos",
+              "ocio", "auto", "educacion", "medicamentos", "ropa", "otros"]
+BUDGETS = {"alimentos": 400000, "salidas": 120000, "auto": 150000, "ocio": 60000}
+DESCRIPTIONS = ["supermercado", "cafe", "nafta", "peaje", "farmacia", "cena", "verduleria", "internet",
+                "veterinaria", "remera", "cine", "luz", "regalo", "sueldo", "freelance"]
+
+def build_expense_rows(count: int, days: int = 730, seed: int = 7) -> list:
+    """
+    Builds a 'Gastos' sheet with count rows spread over the last days days.
+    Values come from small pools so a million rows stay affordable in memory.
+    """
+    from datetime import date, timedelta
+
+    rng = random.Random(seed)
+    today = date.today()
+    dates = [(today - timedelta(days=offset)).isoformat() for offset in range(days)]
+    amounts = [str(rng.randrange(500, 80000, 500)) for _ in range(500)]
+    people = ["Ana", "Juan"]
+    rows = [list(DEFAULT_HEADERS)]
+    for _ in range(count):
+        if rng.random() < 0.05:
+            rows.append([rng.choice(dates), rng.choice(amounts), "Ingreso", rng.choice(["sueldo", "freelance"]), rng.choice(people), "Ingreso"])
+        else:
+            rows.append([rng.choice(dates), rng.choice(amounts), rng.choice(CATEGORIES), rng.choice(DESCRIPTIONS), rng.choice(people), "Gasto"])
+    return rows
+
+def build_worksheets(expense_rows: int) -> dict:
+    return {
+        "Gastos": build_expense_rows(expense_rows),
+        "Categorias": [["Nombre"]] + [[category.capitalize()] for category in CATEGORIES],
+        "Presupuestos": [["Categoria", "MontoMaximo"]] + [[category.capitalize(), str(amount)] for category, amount in BUDGETS.items()],
+    }
+
+# --- Telegram ---
+
+class FakeFile:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def download_as_bytearray(self):
+        return bytearray(self.data)
+
+class FakeBot:
+    """
+    Implements the telegram.Bot calls telegram_api makes. Voice notes are
+    looked up in voice_notes (file_id -> what the user said).
+    """
+    def __init__(self, latency: Latency, stats: CallStats, voice_notes: dict = None):
+        self.latency = latency
+        self.stats = stats
+        self.voice_notes = voice_notes or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        await self.latency.wait_async(self.stats, "telegram.send")
+        self.sent.append((chat_id, text))
+
+    async def get_file(self, file_id):
+        await self.latency.wait_async(self.stats, "telegram.get_file")
+        return FakeFile(VOICE_PREFIX + self.voice_notes[file_id].encode("utf-8"))
+
+    async def get_updates(self, offset=None, timeout=None):
+        return []
+
+    async def delete_webhook(self, drop_pending_updates=False):
+        return True
+
+    async def shutdown(self):
+        pass
+
+# --- Gemini ---
+
+def _schema_name(schema) -> str:
+    for name in ("INTENT_SCHEMA", "EXPENSE_LIST_SCHEMA", "INCOME_SCHEMA", "BUDGET_SCHEMA", "CATEGORY_NAMES_SCHEMA"):
+        if schema is getattr(schemas, name):
+            return name
+    return None
+
+class FakeModel:
+    """
+    Stand-in GenerativeModel. Answers come from the corpus, keyed by the
+    message quoted at the end of each prompt; voice notes are "transcribed"
+    by decoding the fake audio bytes.
+    """
+    MESSAGE_PATTERN = re.compile(r'(?:Mensaje a analizar|Texto a analizar|Text to analyze): "(.*)"', re.DOTALL)
+
+    def __init__(self, answers: dict, latency: Latency, stats: CallStats):
+        self.answers = answers
+        self.latency = latency
+        self.stats = stats
+
+    def _answer(self, contents, generation_config) -> SimpleNamespace:
+        if isinstance(contents, list):
+            audio = next(part for part in contents if isinstance(part, dict))
+            return SimpleNamespace(text=audio["data"][len(VOICE_PREFIX):].decode("utf-8"))
+
+        match = self.MESSAGE_PATTERN.search(contents)
+        intent = self.answers.get(match.group(1).strip() if match else "", {"intent": "OTRO", "entities": {}})
+        entities = intent["entities"]
+        schema = _schema_name((generation_config or {}).get("response_schema"))
+        if schema == "EXPENSE_LIST_SCHEMA":
+            answer = entities.get("expenses", [])
+        elif schema == "INCOME_SCHEMA":
+            answer = {"amount": entities.get("amount", 0), "description": entities.get("description", "")}
+        elif schema == "BUDGET_SCHEMA":
+            answer = {"category": entities.get("category", "otros"), "amount": entities.get("amount", 0)}
+        elif schema == "CATEGORY_NAMES_SCHEMA":
+            answer = {"category_names": entities.get("category_names", [])}
+        else:
+            answer = intent
+        return SimpleNamespace(text=json.dumps(answer, ensure_ascii=False))
+
+    def generate_content(self, contents, generation_config=None):
+        self.latency.wait(self.stats, "llm.generate")
+        return self._answer(contents, generation_config)
+
+    async def generate_content_async(self, contents, generation_config=None):
+        await self.latency.wait_async(self.stats, "llm.generate")
+        return self._answer(contents, generation_config)
+
+def fake_genai_module(stats: CallStats):
+    """
+    The few google.generativeai attributes call_llm touches besides the model.
+    """
+    def upload_file(data, mime_type=None):
+        stats.count("llm.upload")
+        return {"mime_type": mime_type, "data": data.read()}
+
+    return SimpleNamespace(
+        GenerationConfig=lambda **kwargs: kwargs,
+        upload_file=upload_file,
+        configure=lambda **kwargs: None,
+    )
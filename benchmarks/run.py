@@ -0,0 +1,186 @@
+"""
+End-to-end benchmark: replays the Spanish corpus through the real flow, with
+Telegram, Gemini and Google Sheets replaced by in-process fakes at their
+lowest layer (Bot, GenerativeModel and the Sheets client manager).
+
+    python -m benchmarks.run --sizes 1000,10000,100000,1000000 --messages 300
+    python -m benchmarks.run --llm-latency 0.8 --llm-429 0.05 --no-llm-cache
+"""
+import os
+import sys
+import random
+import logging
+import argparse
+import tempfile
+
+# Keep the journal and LLM cache of the benchmark away from the bot's own files.
+# This has to happen before the project modules read their configuration.
+BENCH_DIR = tempfile.mkdtemp(prefix="flux-bench-")
+os.environ["JOURNAL_PATH"] = os.path.join(BENCH_DIR, "journal.sqlite3")
+os.environ["LLM_CACHE_PATH"] = os.path.join(BENCH_DIR, "llm_cache.sqlite3")
+
+import time
+import asyncio
+from collections import defaultdict
+import nodes
+from flow import create_expense_flow
+from utils import call_llm, gsheets_api, telegram_api
+from utils.dispatcher import ChatDispatcher
+from utils.journal import AppendJournal
+from utils.ledger import Ledger
+from utils.llm_cache import LLMResponseCache, LLM_CACHE_TTL_SECONDS
+from utils.rate_limit import SheetsRateLimiter, SHEETS_READS_PER_MINUTE, SHEETS_WRITES_PER_MINUTE
+from benchmarks import corpus
+from benchmarks.fakes import CallStats, Latency, FakeSheetsManager, FakeBot, FakeModel, build_worksheets, fake_genai_module
+
+class TimedFlow:
+    """
+    Wraps the flow to record, per message, the intent and the time from
+    dispatch to the end of the flow (queueing included).
+    """
+    def __init__(self, flow):
+        self.flow = flow
+        self.samples = []
+
+    async def run_async(self, shared: dict):
+        try:
+            return await self.flow.run_async(shared)
+        finally:
+            intent = shared.get("user_intent", {}).get("intent", "SIN_INTENCION")
+            if shared["telegram_input"]["type"] == "audio":
+                intent += " (voz)"
+            self.samples.append((intent, time.perf_counter() - shared["received_at"]))
+
+def build_messages(count: int, chats: int, seed: int = 11):
+    """
+    Returns count Telegram inputs drawn from the corpus, plus the voice notes
+    (file_id -> spoken text) the fake Bot has to serve.
+    """
+    rng = random.Random(seed)
+    messages, voice_notes = [], {}
+    for index in range(count):
+        text, _, is_voice = rng.choice(corpus.MESSAGES)
+        chat_id = 1000 + rng.randrange(chats)
+        if is_voice:
+            file_id = f"voice-{index}"
+            voice_notes[file_id] = text
+            messages.append({"type": "audio", "chat_id": chat_id, "file_id": file_id, "mime_type": "audio/ogg", "user_name": "Bench"})
+        else:
+            messages.append({"type": "text", "chat_id": chat_id, "message_text": text, "user_name": "Bench"})
+    return messages, voice_notes
+
+def install_fakes(sheet_rows: int, voice_notes: dict, args, stats: CallStats) -> Ledger:
+    """
+    Points the Sheets, Telegram and Gemini clients at fresh fakes and gives
+    the nodes a fresh ledger over a sheet of sheet_rows rows.
+    """
+    if args.sheets_per_minute:
+        limiter = SheetsRateLimiter(args.sheets_per_minute, args.sheets_per_minute)
+    else:
+        # 0 = no quota: only the 429s injected by --sheets-429 slow Sheets down.
+        limiter = SheetsRateLimiter(float("inf"), float("inf"), burst=float("inf"))
+    gsheets_api._sheets = FakeSheetsManager(build_worksheets(sheet_rows), Latency(args.sheets_latency, args.sheets_429), stats, limiter)
+    gsheets_api._budgets_cache.invalidate()
+    gsheets_api._categories_cache.invalidate()
+
+    telegram_api.BOT = FakeBot(Latency(args.telegram_latency), stats, voice_notes)
+
+    call_llm._genai_module = fake_genai_module(stats)
+    call_llm._models[call_llm.MODEL_NAME] = FakeModel(corpus.answers(), Latency(args.llm_latency, args.llm_429), stats)
+    # A fresh cache per size, so later sizes don't reuse earlier answers.
+    call_llm.response_cache = LLMResponseCache(
+        os.path.join(BENCH_DIR, f"llm_cache-{sheet_rows}.sqlite3"),
+        ttl=0 if args.no_llm_cache else LLM_CACHE_TTL_SECONDS,
+    )
+
+    journal = AppendJournal(os.path.join(BENCH_DIR, f"journal-{sheet_rows}.sqlite3"), "Gastos")
+    nodes.ledger = Ledger("Gastos", journal=journal)
+    return nodes.ledger
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def report(sheet_rows: int, load_seconds: float, elapsed: float, samples: list, calls: dict, message_count: int):
+    print(f"\n== {sheet_rows:,} sheet rows | ledger load {load_seconds:.2f}s | "
+          f"{message_count} messages in {elapsed:.2f}s -> {message_count / elapsed:.1f} msgs/s")
+
+    by_intent = defaultdict(list)
+    for intent, seconds in samples:
+        by_intent[intent].append(seconds * 1000)
+    by_intent["TOTAL"] = [seconds * 1000 for _, seconds in samples]
+
+    print(f"{'intent':<42}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for intent in sorted(by_intent, key=lambda name: (name == "TOTAL", name)):
+        values = sorted(by_intent[intent])
+        print(f"{intent:<42}{len(values):>6}{percentile(values, 0.50):>10.1f}"
+              f"{percentile(values, 0.95):>10.1f}{percentile(values, 0.99):>10.1f}")
+
+    print("external calls per message: " + ", ".join(
+        f"{kind} {count / message_count:.2f}" for kind, count in sorted(calls.items())
+    ))
+
+async def run_size(sheet_rows: int, args) -> None:
+    stats = CallStats()
+    messages, voice_notes = build_messages(args.messages, args.chats)
+    ledger = install_fakes(sheet_rows, voice_notes, args, stats)
+
+    started = time.perf_counter()
+    await asyncio.to_thread(ledger.refresh)
+    load_seconds = time.perf_counter() - started
+    ledger.start_write_behind()
+    valid_categories = await asyncio.to_thread(gsheets_api.get_categories)
+    stats.reset()
+
+    timed_flow = TimedFlow(create_expense_flow())
+    dispatcher = ChatDispatcher(timed_flow, max_workers=args.workers)
+    interval = 1 / args.rate if args.rate else 0
+
+    started = time.perf_counter()
+    for telegram_input in messages:
+        shared = {
+            "telegram_input": telegram_input,
+            "parsed_transactions": [],
+            "valid_categories": valid_categories,
+            "received_at": time.perf_counter(),
+        }
+        await dispatcher.dispatch(shared)
+        if interval:
+            await asyncio.sleep(interval)
+    await dispatcher.join()
+    elapsed = time.perf_counter() - started
+
+    await asyncio.to_thread(ledger.stop_write_behind)
+    report(sheet_rows, load_seconds, elapsed, timed_flow.samples, stats.snapshot(), len(messages))
+    print(f"sheets quota: {gsheets_api.rate_limit_stats()}")
+
+async def run(args):
+    # One event loop for every size, like the bot.
+    for sheet_rows in args.sizes:
+        await run_size(sheet_rows, args)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a message corpus through the flow against local fakes.")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        type=lambda value: [int(size) for size in value.split(",")],
+                        help="Comma-separated 'Gastos' sheet sizes, in rows.")
+    parser.add_argument("--messages", type=int, default=300, help="Messages replayed per sheet size.")
+    parser.add_argument("--chats", type=int, default=20, help="Distinct chats the messages come from.")
+    parser.add_argument("--workers", type=int, default=16, help="Flows in progress at once (FLOW_WORKERS).")
+    parser.add_argument("--rate", type=float, default=0, help="Arrival rate in msgs/s (0 = all at once).")
+    parser.add_argument("--llm-latency", type=float, default=0.6, help="Mean Gemini latency, seconds.")
+    parser.add_argument("--llm-429", type=float, default=0.0, help="Probability of a Gemini 429.")
+    parser.add_argument("--sheets-latency", type=float, default=0.3, help="Mean Google Sheets latency, seconds.")
+    parser.add_argument("--sheets-429", type=float, default=0.0, help="Probability of a Google Sheets 429.")
+    parser.add_argument("--sheets-per-minute", type=float, default=min(SHEETS_READS_PER_MINUTE, SHEETS_WRITES_PER_MINUTE),
+                        help="Sheets read and write quota per minute (0 = unlimited).")
+    parser.add_argument("--telegram-latency", type=float, default=0.1, help="Mean Telegram API latency, seconds.")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Never serve LLM answers from the cache.")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's own logs.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
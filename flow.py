@@ -1,4 +1,5 @@
-from pocketflow import Flow
+from pocketflow import AsyncFlow
+from utils import tracing
 from nodes import (
     GetMessageNode,
     TranscribeAudioNode,
@@ -74,5 +75,13 @@ def create_expense_flow():
         "fallback": fallback_node
     }
     
-    # 4. Create the Flow object, specifying the start node
-    return Flow(start=get_message_node)
+    # 4. Time every node's prep/exec/post (no-op when tracing is disabled)
+    tracing.trace_nodes(
+        get_message_node, transcribe_audio_node, detect_intent_node, query_budget_node, add_category_node,
+        query_expenses_by_category_node, help_node, fallback_node, parse_expense_node, parse_income_node,
+        process_transaction_node, fetch_data_node, format_summary_node, send_summary_node,
+        parse_budget_node, set_budget_node,
+    )
+
+    # 5. Create the Flow object, specifying the start node
+    return AsyncFlow(start=get_message_node)
@@ -1,12 +1,45 @@
 import time
-from flow import create_expense_flow
+
+STARTED_AT = time.perf_counter()
+
+import os
+import asyncio
 import logging
+from utils import config
+from flow import create_expense_flow
 from utils.logger_config import setup_logger
-from utils.gsheets_api import get_categories
+from utils.gsheets_api import get_categories, cache_stats, rate_limit_stats
+from utils.telegram_api import (
+    get_pending_updates, start_polling, shutdown_bot, WebhookReceiver,
+    TELEGRAM_MODE, WEBHOOK_URL, WEBHOOK_PORT, WEBHOOK_SECRET
+)
+from utils.dispatcher import ChatDispatcher
+from utils.ledger import ledger
+from utils import fast_path, transcription, tracing, rate_limit
+from utils.llm_cache import response_cache
 
 setup_logger() 
 logger = logging.getLogger(__name__)
 
+FLOW_WORKERS = int(os.getenv("FLOW_WORKERS", "16"))
+STATS_LOG_SECONDS = float(os.getenv("STATS_LOG_SECONDS", "600"))
+
+startup_marks = [("imports", time.perf_counter())]
+
+def mark_startup(phase: str):
+    startup_marks.append((phase, time.perf_counter()))
+
+def log_startup_report():
+    """
+    Logs how long each startup phase took and the total time until the first poll.
+    """
+    phases = []
+    previous = STARTED_AT
+    for phase, at in startup_marks:
+        phases.append(f"{phase} {at - previous:.2f}s")
+        previous = at
+    logger.info(f"-> Startup timing: {', '.join(phases)}. Time to first poll: {previous - STARTED_AT:.2f}s.")
+
 """
 VALID_CATEGORIES = [
     "Alimentos", "Alquiler", "Salidas", "Expensas", "Deuda Visa",
@@ -15,26 +48,91 @@ VALID_CATEGORIES = [
 ]
 """
 
-def main():
-    logger.info("🚀 Finance Bot starting...")
-    
+async def run_bot():
     expense_flow = create_expense_flow()
+    dispatcher = ChatDispatcher(expense_flow, max_workers=FLOW_WORKERS)
+    # The ledger loads in the background; a query that arrives first waits for it.
+    # Its reads yield the Sheets quota to writes and to users' own reads.
+    ledger_warm_up = asyncio.create_task(asyncio.to_thread(rate_limit.in_background, ledger.refresh))
+    ledger.start_write_behind()
+    mark_startup("flow")
+
+    metrics_server = None
+    if tracing.TRACING_ENABLED and config.METRICS_PORT:
+        metrics_server = tracing.MetricsServer(config.METRICS_PORT)
+        await metrics_server.start()
+    
+    if TELEGRAM_MODE == "webhook":
+        receiver = WebhookReceiver(WEBHOOK_URL, WEBHOOK_PORT, WEBHOOK_SECRET)
+        await receiver.start()
+        fetch_updates = receiver.get_pending_updates
+    else:
+        receiver = None
+        await start_polling()
+        fetch_updates = get_pending_updates
+    logger.info(f"-> Receiving Telegram updates via {TELEGRAM_MODE}.")
+    mark_startup("telegram")
+    log_startup_report()
+    
+    last_stats_log = time.monotonic()
+    retry_delay = 1
     
-    while True:
-        valid_categories_from_sheet = get_categories()
-        shared = {
-            "telegram_input": {},
-            "parsed_transactions": [],
-            "valid_categories": valid_categories_from_sheet
-        }
-        
-        expense_flow.run(shared)
-        
-        if not shared.get("telegram_input"):
-            time.sleep(5)
+    try:
+        while True:
+            if time.monotonic() - last_stats_log > STATS_LOG_SECONDS:
+                logger.info(f"-> Sheet cache stats: {cache_stats()}")
+                logger.info(f"-> Sheets quota stats: {rate_limit_stats()}")
+                logger.info(f"-> Intent fast path stats: {fast_path.stats.as_dict()}")
+                logger.info(f"-> LLM response cache stats: {response_cache.stats()}")
+                if tracing.TRACING_ENABLED:
+                    logger.info(f"-> Timing stats: {tracing.stats()}")
+                last_stats_log = time.monotonic()
+
+            # Long poll (or webhook wait): returns as soon as messages arrive, no sleeping needed.
+            try:
+                pending_messages = await fetch_updates()
+                retry_delay = 1
+            except Exception as e:
+                logger.error(f"Error fetching Telegram updates: {e}. Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+                continue
+            if not pending_messages:
+                continue
+
+            valid_categories_from_sheet = await asyncio.to_thread(get_categories)
+            for telegram_input in pending_messages:
+                shared = {
+                    "telegram_input": telegram_input,
+                    "parsed_transactions": [],
+                    "valid_categories": valid_categories_from_sheet
+                }
+                
+                await dispatcher.dispatch(shared)
+    finally:
+        if not ledger_warm_up.done():
+            ledger_warm_up.cancel()
+        await dispatcher.join()
+        await asyncio.to_thread(ledger.stop_write_behind)
+        if receiver is not None:
+            await receiver.stop()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await shutdown_bot()
+
+def main():
+    logger.info(f"🚀 Finance Bot starting with {FLOW_WORKERS} flow workers...")
+    config.validate()
+    mark_startup("config")
+    transcription.start()
+    mark_startup("transcription")
+    try:
+        asyncio.run(run_bot())
+    finally:
+        transcription.stop()
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        logger.info("\nBot stopped manually.")
\ No newline at end of file
+        logger.info("\nBot stopped manually.")
@@ -1,45 +1,138 @@
-import json
 import asyncio
 import logging
 from datetime import datetime, date, timedelta
 from collections import defaultdict
-from pocketflow import Node, BatchNode
+from pocketflow import Node, AsyncNode
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from utils.telegram_api import get_latest_updates, send_message
-from utils.call_llm import call_llm, transcribe_audio_with_llm
-from utils.gsheets_api import append_row, get_all_records, get_budgets, set_budget, add_category
+from utils.telegram_api import send_message, download_voice
+from utils.call_llm import call_llm_json_async
+from utils.schemas import INTENT_SCHEMA, EXPENSE_LIST_SCHEMA, INCOME_SCHEMA, BUDGET_SCHEMA, CATEGORY_NAMES_SCHEMA
+from utils.gsheets_api import get_budgets, set_budget, add_category
+from utils.ledger import ledger
+from utils import fast_path, transcription
+from utils.dates import resolve_period
 
 logger = logging.getLogger(__name__)
 
-def calculate_monthly_spend(category: str, all_records: list) -> float:
+def calculate_monthly_spend(category: str) -> float:
         """
         Calculates total spending for a category in the current month.
         """
-        total = 0.0
-        current_month = datetime.now().month
-        current_year = datetime.now().year
+        today = date.today()
+        return ledger.monthly_spend(category, today.year, today.month)
+
+def parse_date_range(entities: dict):
+    """
+    Parses the "start_date" and "end_date" entities into dates.
+    Returns None if either is missing and raises ValueError if either is malformed.
+    """
+    start_date_str = entities.get("start_date")
+    end_date_str = entities.get("end_date")
+    if not all([start_date_str, end_date_str]):
+        return None
+    start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+    return start_date, end_date
+
+def resolve_entity_dates(entities: dict, message_text: str):
+    """
+    Fills "start_date"/"end_date" from the raw "period" phrase the LLM returned,
+    falling back to the whole message. Dates are computed locally, never by the LLM.
+    """
+    if "period" not in entities or entities.get("start_date"):
+        return
+    period = resolve_period(entities.get("period") or "") or resolve_period(message_text)
+    if period:
+        start_date, end_date, _ = period
+        entities["start_date"] = start_date.isoformat()
+        entities["end_date"] = end_date.isoformat()
+    else:
+        logger.warning(f"-> Could not resolve period '{entities.get('period')}'.")
+
+def build_budget_alert(category: str, added_amount: float, budget_amount):
+    """
+    Returns the alert to send if the latest expenses pushed a category across a
+    budget threshold, or None.
+    """
+    if not budget_amount:
+        return None
+    logger.info(f"-> Budget found for '{category}': {budget_amount}. Checking status...")
+    
+    total_spent_this_month = calculate_monthly_spend(category)
+    spent_before_this = total_spent_this_month - added_amount
+    
+    logger.info(f"-> Budget Check: Spent before={spent_before_this}, Spent now={total_spent_this_month}, Budget={budget_amount}")
+    
+    percentage_before = (spent_before_this / budget_amount) * 100 if budget_amount > 0 else 0
+    percentage_after = (total_spent_this_month / budget_amount) * 100 if budget_amount > 0 else 0
+    
+    # Case 1: You just crossed 100%
+    if percentage_after >= 100 and percentage_before < 100:
+        return (f"🚨 ¡Alerta de Presupuesto! 🚨\n"
+                f"Acabas de superar el 100% de tu presupuesto para '{category.capitalize()}'.\n"
+                f"Gastado este mes: {total_spent_this_month:,.2f} de {budget_amount:,.2f} PESOS.")
+    # Case 2: You were already over 100% and are spending more
+    elif percentage_after > 100 and percentage_before >= 100:
+        return (f"🚨 ¡Sigues por encima del presupuesto! 🚨\n"
+                f"Nuevo gasto en '{category.capitalize()}' mientras estás sobre el límite.\n"
+                f"Gastado este mes: {total_spent_this_month:,.2f} de {budget_amount:,.2f} PESOS.")
+    # Case 3: You just crossed 85%
+    elif percentage_after >= 85 and percentage_before < 85:
+        return (f"⚠️ ¡Atención! ⚠️\n"
+                f"Ya has utilizado más del 85% de tu presupuesto para '{category.capitalize()}'.\n"
+                f"Gastado este mes: {total_spent_this_month:,.2f} de {budget_amount:,.2f} PESOS.")
+    return None
+
+def clean_expense_list(raw_expenses: list, user_name: str, chat_id: int, valid_categories: list) -> list[dict]:
+    """
+    Turns the expenses extracted by the LLM into transactions ready to be saved.
+    """
+    clean_expenses = []
+    today_date = datetime.now().strftime("%Y-%m-%d")
+    
+    for expense in raw_expenses:
+        if not isinstance(expense, dict):
+            continue
+        clean_expense = {
+            "date": today_date,
+            "who": user_name,
+            "chat_id": chat_id,
+            "amount": expense.get("amount"),
+            "description": expense.get("description", expense.get("establishment", "Sin descripción")),
+            "category": expense.get("category", expense.get("alimentos", "otros")).lower(),
+            "type": "Gasto"
+        }
+
+        if clean_expense["category"] not in valid_categories:
+            logger.warning(f"-> Invalid category '{clean_expense['category']}', assigning 'otros'.")
+            clean_expense["category"] = "otros"
         
-        for record in all_records:
-            if record.get('Tipo') == 'Gasto' and record.get('Categoria', '').lower() == category:
-                try:
-                    record_date = datetime.strptime(record.get('Fecha', ''), "%Y-%m-%d")
-                    if record_date.month == current_month and record_date.year == current_year:
-                        total += float(record.get('Monto', 0))
-                except (ValueError, TypeError):
-                    continue
-        return total
+        clean_expenses.append(clean_expense)
+
+    return clean_expenses
+
+def clean_income(raw_income: dict, user_name: str, chat_id: int) -> dict:
+    """
+    Turns the income extracted by the LLM into a transaction ready to be saved.
+    """
+    return {
+        "date": datetime.now().strftime("%Y-%m-%d"), "who": user_name, "chat_id": chat_id,
+        "amount": raw_income.get("amount"),
+        "description": raw_income.get("description", "Sin descripción"),
+        "category": "Ingreso",
+        "type": "Ingreso"
+    }
 
 class GetMessageNode(Node):
-    # Modified to handle different message types
-    def exec(self, _):
-        logger.debug("Node [GetMessageNode]: Fetching new messages...")
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        update_data = loop.run_until_complete(get_latest_updates())
-        return update_data
+    """
+    Routes one message from the pending Telegram batch that main.main fetched.
+    """
+    def prep(self, shared):
+        return shared.get("telegram_input")
+
+    def exec(self, telegram_input):
+        logger.debug("Node [GetMessageNode]: Routing incoming message...")
+        return telegram_input
 
     def post(self, shared, _, exec_res):
         if not exec_res:
@@ -56,62 +149,79 @@ class GetMessageNode(Node):
         
         return None
     
-class TranscribeAudioNode(Node):
-    def prep(self, shared):
-        return shared.get("telegram_input", {}).get("audio_path")
+class TranscribeAudioNode(AsyncNode):
+    async def prep_async(self, shared):
+        return shared.get("telegram_input", {})
 
-    def exec(self, audio_path):
-        if not audio_path: return None
-        logger.info("Node [TranscribeAudioNode]: Transcribing audio...")
-        transcribed_text = transcribe_audio_with_llm(audio_path)
+    async def exec_async(self, telegram_input):
+        file_id = telegram_input.get("file_id")
+        if not file_id: return None
+        logger.info("Node [TranscribeAudioNode]: Downloading and transcribing audio...")
+        try:
+            audio_bytes = await download_voice(file_id)
+        except Exception as e:
+            logger.error(f"-> Could not download the voice note: {e}")
+            return None
+        transcribed_text = await asyncio.to_thread(transcription.transcribe, audio_bytes, telegram_input.get("mime_type", "audio/ogg"))
         logger.info(f"-> Transcription result: '{transcribed_text}'")
         return transcribed_text
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         if exec_res:
             shared["telegram_input"]["message_text"] = exec_res
             return "default"
         return None
     
-class DetectIntentNode(Node):
-    def prep(self, shared):
-        return shared.get("telegram_input", {}).get("message_text")
+class DetectIntentNode(AsyncNode):
+    """
+    Classifies the message and, in the same LLM call, extracts everything the
+    chosen branch needs, so write commands cost a single round trip.
+    """
+    async def prep_async(self, shared):
+        return {
+            "message_text": shared.get("telegram_input", {}).get("message_text"),
+            "valid_categories": shared.get("valid_categories", ["otros"])
+        }
 
-    def exec(self, message_text):
+    async def exec_async(self, prep_data):
+        message_text = prep_data.get("message_text")
         if not message_text: return None
+
+        fast_result = fast_path.classify(message_text, prep_data.get("valid_categories"))
+        if fast_result:
+            logger.info(f"Node [DetectIntentNode]: Fast path matched without LLM: {fast_result}")
+            return fast_result
+
         logger.info("Node [DetectIntentNode]: Classifying user intent...")
         
-        today_str = datetime.now().strftime("%Y-%m-%d")
+        categories_str = ", ".join(prep_data.get("valid_categories") or ["otros"])
 
         prompt = f"""
-        Analiza el mensaje del usuario y clasifica su intención.
-        La fecha de hoy es {today_str}.
-        Responde ÚNICAMENTE con un objeto JSON.
+        Analiza el mensaje del usuario, clasifica su intención y extrae sus datos.
+        Responde ÚNICAMENTE con un objeto JSON con las claves "intent" y "entities".
 
         Las intenciones posibles son: "REGISTRAR_GASTO", "REGISTRAR_INGRESO", "CONSULTAR_GASTOS", "DEFINIR_PRESUPUESTO", "CONSULTAR_PRESUPUESTO","AGREGAR_CATEGORIA", "CONSULTAR_GASTOS_POR_CATEGORIA", "PEDIR_AYUDA", "OTRO".
 
-        **REGLAS PARA EXTRACCIÓN DE FECHAS:**
-        - Para "CONSULTAR_GASTOS" y "CONSULTAR_GASTOS_POR_CATEGORIA", DEBES extraer "start_date" y "end_date" en formato "YYYY-MM-DD".
-        - "este mes": Calcula el primer y último día del mes actual.
-        - "mes pasado": Calcula el primer y último día del mes anterior.
-        - "ayer": Ambas fechas son el día de ayer.
-        - "últimos 10 días": Calcula desde hace 10 días hasta hoy.
-
-        **REGLAS PARA FECHAS:**
-        - "este mes": Calcula el primer y último día del mes actual.
-        - "mes pasado": Calcula el primer y último día del mes anterior.
-        - "ayer": Ambas fechas son el día de ayer.
-        - "últimos 7 días": Calcula desde hace 7 días hasta hoy.
+        **CONTENIDO DE "entities" SEGÚN LA INTENCIÓN:**
+        - "REGISTRAR_GASTO": {{"expenses": [{{"amount": <numero>, "category": "<categoria>", "description": "<descripcion>"}}, ...]}}. Un objeto por cada gasto del mensaje. "category" DEBE ser uno de: [{categories_str}]. Si no encaja, usa "otros". "description" es el detalle del gasto (ej: "supermercado").
+        - "REGISTRAR_INGRESO": {{"amount": <numero>, "description": "<descripcion>"}}.
+        - "DEFINIR_PRESUPUESTO": {{"category": "<categoria en minúsculas>", "amount": <numero>}}.
+        - "AGREGAR_CATEGORIA": {{"category_names": ["<nombre>", ...]}}.
+        - "CONSULTAR_PRESUPUESTO": {{"category": "<categoria>"}}.
+        - "CONSULTAR_GASTOS": {{"period": "<período tal como lo dijo el usuario>"}}.
+        - "CONSULTAR_GASTOS_POR_CATEGORIA": {{"categories": ["<categoria>", ...], "period": "<período tal como lo dijo el usuario>"}}.
+        - "PEDIR_AYUDA" y "OTRO": {{}}.
+        No calcules fechas: copia en "period" la expresión de tiempo del mensaje (ej: "hoy", "mes pasado", "últimos 15 días").
 
         Ejemplos:
-        - Mensaje: "gaste 5000 en cafe" -> {{"intent": "REGISTRAR_GASTO", "entities": {{}}}}
-        - Mensaje: "cargué 100000 de mi sueldo" -> {{"intent": "REGISTRAR_INGRESO", "entities": {{}}}}
-        - Mensaje: "cuanto gaste hoy?" -> {{"intent": "CONSULTAR_GASTOS", "entities": {{"start_date": "{today_str}", "end_date": "{today_str}"}}}}
-        - Mensaje: "agrega categoria de Viajes" -> {{"intent": "AGREGAR_CATEGORIA", "entities": {{}}}}
-        - Mensaje: "fijar presupuesto de 20000 para Salidas" -> {{"intent": "DEFINIR_PRESUPUESTO", "entities": {{}}}}
+        - Mensaje: "gaste 5000 en cafe" -> {{"intent": "REGISTRAR_GASTO", "entities": {{"expenses": [{{"amount": 5000, "category": "salidas", "description": "cafe"}}]}}}}
+        - Mensaje: "cargué nafta por 15000 y 3000 de un peaje" -> {{"intent": "REGISTRAR_GASTO", "entities": {{"expenses": [{{"amount": 15000, "category": "auto", "description": "nafta"}}, {{"amount": 3000, "category": "auto", "description": "peaje"}}]}}}}
+        - Mensaje: "cargué 100000 de mi sueldo" -> {{"intent": "REGISTRAR_INGRESO", "entities": {{"amount": 100000, "description": "sueldo"}}}}
+        - Mensaje: "cuanto gaste hoy?" -> {{"intent": "CONSULTAR_GASTOS", "entities": {{"period": "hoy"}}}}
+        - Mensaje: "agrega categoria de Viajes" -> {{"intent": "AGREGAR_CATEGORIA", "entities": {{"category_names": ["Viajes"]}}}}
+        - Mensaje: "fijar presupuesto de 20000 para Salidas" -> {{"intent": "DEFINIR_PRESUPUESTO", "entities": {{"category": "salidas", "amount": 20000}}}}
         - Mensaje: "como voy con el presupuesto de alimentos" -> {{"intent": "CONSULTAR_PRESUPUESTO", "entities": {{"category": "alimentos"}}}}
-        - Mensaje: "mostrame los gastos de auto y mascotas del mes pasado" -> {{"intent": "CONSULTAR_GASTOS_POR_CATEGORIA", "entities": {{"categories": ["auto", "mascotas"], "start_date": "...", "end_date": "..."}}}}
-        - Mensaje: "gastos en salidas la semana pasada" -> {{"intent": "CONSULTAR_GASTOS_POR_CATEGORIA", "entities": {{"categories": ["salidas"], "start_date": "...", "end_date": "..."}}}}
+        - Mensaje: "mostrame los gastos de auto y mascotas del mes pasado" -> {{"intent": "CONSULTAR_GASTOS_POR_CATEGORIA", "entities": {{"categories": ["auto", "mascotas"], "period": "mes pasado"}}}}
         - Mensaje: "ayuda" -> {{"intent": "PEDIR_AYUDA", "entities": {{}}}}
         - Mensaje: "/help" -> {{"intent": "PEDIR_AYUDA", "entities": {{}}}}
         - Mensaje: "que podes hacer?" -> {{"intent": "PEDIR_AYUDA", "entities": {{}}}}
@@ -120,15 +230,14 @@ class DetectIntentNode(Node):
         Mensaje a analizar: "{message_text}"
         """
         
-        response_str = call_llm(prompt)
-        logger.info(f"-> LLM intent response: {response_str}")
-        try:
-            clean_response = response_str.strip().replace("```json", "").replace("```", "")
-            return json.loads(clean_response)
-        except (json.JSONDecodeError, TypeError):
+        intent_data = await call_llm_json_async(prompt, INTENT_SCHEMA, cache_text=message_text)
+        logger.info(f"-> LLM intent response: {intent_data}")
+        if intent_data is None:
             return {"intent": "OTRO", "entities": {}}
+        resolve_entity_dates(intent_data["entities"], message_text)
+        return intent_data
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         if not exec_res: return None
         shared["user_intent"] = exec_res
         intent = exec_res.get("intent")
@@ -160,14 +269,14 @@ class DetectIntentNode(Node):
             logger.info("-> Intent detected: OTRO. Routing to fallback.")
             return "fallback"
 
-class HelpNode(Node):
+class HelpNode(AsyncNode):
     """
     Sends a comprehensive help message listing all bot features.
     """
-    def prep(self, shared):
+    async def prep_async(self, shared):
         return shared.get("telegram_input", {}).get("chat_id")
 
-    def exec(self, chat_id):
+    async def exec_async(self, chat_id):
         if not chat_id: return {"message": "Error: chat_id not found."}
 
         help_text = """
@@ -201,23 +310,22 @@ class HelpNode(Node):
 
         return {"message": help_text, "chat_id": chat_id, "reply_markup": reply_markup}
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         chat_id = exec_res.get("chat_id")
         message = exec_res.get("message")
         reply_markup = exec_res.get("reply_markup")
         if chat_id and message:
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(send_message(chat_id, message, reply_markup))
+            await send_message(chat_id, message, reply_markup)
         return None
 
-class FallbackNode(Node):
+class FallbackNode(AsyncNode):
     """
     Handles cases where the bot doesn't understand the user's intent.
     """
-    def prep(self, shared):
+    async def prep_async(self, shared):
         return shared.get("telegram_input", {}).get("chat_id")
 
-    def exec(self, chat_id):
+    async def exec_async(self, chat_id):
         if not chat_id: return {"message": "Error: chat_id not found."}
 
         fallback_text = """
@@ -235,23 +343,22 @@ class FallbackNode(Node):
 
         return {"message": fallback_text, "chat_id": chat_id, "reply_markup": reply_markup}
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         chat_id = exec_res.get("chat_id")
         message = exec_res.get("message")
         reply_markup = exec_res.get("reply_markup")
         if chat_id and message:
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(send_message(chat_id, message, reply_markup))
+            await send_message(chat_id, message, reply_markup)
         return None
 
-class QueryExpensesByCategoryNode(Node):
-    def prep(self, shared):
+class QueryExpensesByCategoryNode(AsyncNode):
+    async def prep_async(self, shared):
         return {
             "user_intent": shared.get("user_intent", {}),
             "chat_id": shared.get("telegram_input", {}).get("chat_id")
         }
 
-    def exec(self, prep_data):
+    async def exec_async(self, prep_data):
         user_intent = prep_data.get("user_intent")
         chat_id = prep_data.get("chat_id")
         if not all([user_intent, chat_id]):
@@ -268,24 +375,13 @@ class QueryExpensesByCategoryNode(Node):
         logger.info(f"Node [QueryExpensesByCategoryNode]: Querying for categories {categories_to_query} from {start_date_str} to {end_date_str}...")
 
         try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            start_date, end_date = parse_date_range(entities)
         except ValueError:
             return {"message": "Recibí un formato de fecha inválido. Por favor, intenta de nuevo.", "chat_id": chat_id}
 
-        all_records = get_all_records("Gastos")
-        
-        date_filtered_records = [
-            r for r in all_records
-            if r.get("Fecha") and start_date <= datetime.strptime(r["Fecha"], "%Y-%m-%d").date() <= end_date
-        ]
+        final_records = await asyncio.to_thread(ledger.expenses_in, categories_to_query, start_date, end_date)
 
-        logger.debug(f"Found {len(date_filtered_records)} records after date filtering: {date_filtered_records}")
-        
-        final_records = [
-            r for r in date_filtered_records
-            if r.get("Tipo") == "Gasto" and r.get("Categoria", "").strip().lower() in categories_to_query
-        ]
+        logger.debug(f"Found {len(final_records)} matching records.")
 
         title_period = f"del {start_date_str} al {end_date_str}"
         if start_date_str == end_date_str:
@@ -295,12 +391,12 @@ class QueryExpensesByCategoryNode(Node):
             message = f"No se encontraron gastos para las categorías {', '.join(categories_to_query)} durante el período {title_period}."
             return {"message": message, "chat_id": chat_id}
 
-        total_spent = sum(float(r.get('Monto', 0)) for r in final_records)
+        total_spent = sum(t.amount for t in final_records)
         
         grouped_expenses = defaultdict(list)
-        for r in final_records:
-            category_key = r.get('Categoria', 'Sin Categoria').strip().capitalize()
-            grouped_expenses[category_key].append(f"  - {r.get('Fecha')}: {r.get('Descripcion')} - ${float(r.get('Monto', 0)):,.2f}")
+        for t in final_records:
+            category_key = (t.category or 'sin categoria').capitalize()
+            grouped_expenses[category_key].append(f"  - {t.date}: {t.description} - ${t.amount:,.2f}")
 
         message_lines = [f"🔎 Detalle de Gastos para {', '.join(c.capitalize() for c in categories_to_query)} ({title_period}):\n"]
         
@@ -313,27 +409,32 @@ class QueryExpensesByCategoryNode(Node):
         
         return {"message": "\n".join(message_lines), "chat_id": chat_id}
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         chat_id = exec_res.get("chat_id")
         message = exec_res.get("message")
         if chat_id and message:
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(send_message(chat_id, message))
+            await send_message(chat_id, message)
         return None
 
-class AddCategoryNode(Node):
-    def prep(self, shared):
+class AddCategoryNode(AsyncNode):
+    async def prep_async(self, shared):
         return {
             "message_text": shared.get("telegram_input", {}).get("message_text"),
-            "chat_id": shared.get("telegram_input", {}).get("chat_id")
+            "chat_id": shared.get("telegram_input", {}).get("chat_id"),
+            "entities": shared.get("user_intent", {}).get("entities", {})
         }
 
-    def exec(self, prep_data):
+    async def exec_async(self, prep_data):
         message_text = prep_data.get("message_text")
         chat_id = prep_data.get("chat_id")
         if not all([message_text, chat_id]):
             return {"message": "Error: Missing data to add categories."}
 
+        category_names = prep_data.get("entities", {}).get("category_names")
+        if isinstance(category_names, list) and category_names:
+            logger.info("Node [AddCategoryNode]: Using category names extracted with the intent.")
+            return await self.add_categories(category_names, chat_id)
+
         logger.info("Node [AddCategoryNode]: Parsing new category names...")
         
         prompt = f"""
@@ -347,55 +448,62 @@ class AddCategoryNode(Node):
 
         Text to analyze: "{message_text}"
         """
-        llm_response_str = call_llm(prompt)
-        logger.info(f"-> LLM category parse response: {llm_response_str}")
+        parsed_data = await call_llm_json_async(prompt, CATEGORY_NAMES_SCHEMA, cache_text=message_text)
+        logger.info(f"-> LLM category parse response: {parsed_data}")
+        if parsed_data is None:
+            return {"message": "Hubo un error procesando tu solicitud.", "chat_id": chat_id}
 
-        try:
-            parsed_data = json.loads(llm_response_str.strip().replace("```json", "").replace("```", ""))
-            category_names = parsed_data.get("category_names")
-            
-            if not category_names or not isinstance(category_names, list):
-                return {"message": "No pude identificar ninguna categoría nueva para agregar."}
+        category_names = parsed_data["category_names"]
+        if not category_names:
+            return {"message": "No pude identificar ninguna categoría nueva para agregar."}
 
-            added_categories = []
-            existing_categories = []
+        return await self.add_categories(category_names, chat_id)
 
-            for name in category_names:
-                if add_category(name):
-                    added_categories.append(name.capitalize())
-                else:
-                    existing_categories.append(name.capitalize())
-            
-            response_parts = []
-            if added_categories:
-                response_parts.append(f"✅ Categorías agregadas: {', '.join(added_categories)}.")
-            if existing_categories:
-                response_parts.append(f"⚠️ Estas categorías ya existían: {', '.join(existing_categories)}.")
-            
-            message = "\n".join(response_parts)
-            return {"message": message, "chat_id": chat_id}
+    async def add_categories(self, category_names: list, chat_id) -> dict:
+        added_categories = []
+        existing_categories = []
 
-        except (json.JSONDecodeError, TypeError):
-            return {"message": "Hubo un error procesando tu solicitud.", "chat_id": chat_id}
+        for name in category_names:
+            if await asyncio.to_thread(add_category, name):
+                added_categories.append(name.capitalize())
+            else:
+                existing_categories.append(name.capitalize())
+        
+        response_parts = []
+        if added_categories:
+            response_parts.append(f"✅ Categorías agregadas: {', '.join(added_categories)}.")
+        if existing_categories:
+            response_parts.append(f"⚠️ Estas categorías ya existían: {', '.join(existing_categories)}.")
+        
+        message = "\n".join(response_parts)
+        return {"message": message, "chat_id": chat_id}
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         chat_id = exec_res.get("chat_id")
         message = exec_res.get("message")
         if chat_id and message:
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(send_message(chat_id, message))
+            await send_message(chat_id, message)
         
         return None
 
-class ParseExpenseListNode(Node):
-    def prep(self, shared):
-        return {"telegram_input": shared.get("telegram_input", {}), "valid_categories": shared.get("valid_categories", ["otros"])}
+class ParseExpenseListNode(AsyncNode):
+    async def prep_async(self, shared):
+        return {
+            "telegram_input": shared.get("telegram_input", {}),
+            "valid_categories": shared.get("valid_categories", ["otros"]),
+            "entities": shared.get("user_intent", {}).get("entities", {})
+        }
 
-    def exec(self, prep_data):
+    async def exec_async(self, prep_data):
         telegram_input, valid_categories = prep_data["telegram_input"], prep_data["valid_categories"]
         message_text, user_name, chat_id = telegram_input.get("message_text"), telegram_input.get("user_name"), telegram_input.get("chat_id")
         
         if not all([message_text, user_name, chat_id]): return None
+
+        raw_expenses = prep_data.get("entities", {}).get("expenses")
+        if isinstance(raw_expenses, list) and raw_expenses:
+            logger.info("Node [ParseExpenseListNode]: Using expenses extracted with the intent.")
+            return clean_expense_list(raw_expenses, user_name, chat_id, valid_categories)
         
         logger.info(f"Node [ParseExpenseListNode]: Sending text to LLM for analysis...")
         categories_str = ", ".join(valid_categories)
@@ -419,54 +527,38 @@ class ParseExpenseListNode(Node):
         Texto a analizar: "{message_text}"
         """
         
-        llm_response_str = call_llm(prompt)
-        logger.info(f"-> LLM response: {llm_response_str}")
-        
-        try:
-            raw_expenses = json.loads(llm_response_str.strip().replace("```json", "").replace("```", ""))
-            
-            clean_expenses = []
-            today_date = datetime.now().strftime("%Y-%m-%d")
-            
-            for expense in raw_expenses:
-                clean_expense = {
-                    "date": today_date,
-                    "who": user_name,
-                    "chat_id": chat_id,
-                    "amount": expense.get("amount"),
-                    "description": expense.get("description", expense.get("establishment", "Sin descripción")),
-                    "category": expense.get("category", expense.get("alimentos", "otros")).lower(),
-                    "type": "Gasto"
-                }
-
-                if clean_expense["category"] not in valid_categories:
-                    logger.warning(f"-> Invalid category '{clean_expense['category']}', assigning 'otros'.")
-                    clean_expense["category"] = "otros"
-                
-                clean_expenses.append(clean_expense)
-
-            return clean_expenses
-
-        except (json.JSONDecodeError, TypeError):
-            logger.error("-> Error: LLM response is not valid JSON.")
+        raw_expenses = await call_llm_json_async(prompt, EXPENSE_LIST_SCHEMA, cache_text=message_text)
+        logger.info(f"-> LLM response: {raw_expenses}")
+        if raw_expenses is None:
+            logger.error("-> Error: LLM did not return a valid expense list.")
             return []
+        return clean_expense_list(raw_expenses, user_name, chat_id, valid_categories)
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         if exec_res: 
             shared["parsed_transactions"] = exec_res
         return "default"
     
-class ParseIncomeNode(Node):
-    def prep(self, shared):
-        return shared.get("telegram_input", {})
+class ParseIncomeNode(AsyncNode):
+    async def prep_async(self, shared):
+        return {
+            "telegram_input": shared.get("telegram_input", {}),
+            "entities": shared.get("user_intent", {}).get("entities", {})
+        }
 
-    def exec(self, telegram_input):
+    async def exec_async(self, prep_data):
+        telegram_input = prep_data["telegram_input"]
         message_text = telegram_input.get("message_text")
         user_name = telegram_input.get("user_name")
         chat_id = telegram_input.get("chat_id")
 
         if not all([message_text, user_name, chat_id]): return None
 
+        entities = prep_data.get("entities", {})
+        if entities.get("amount") is not None:
+            logger.info("Node [ParseIncomeNode]: Using income extracted with the intent.")
+            return [clean_income(entities, user_name, chat_id)]
+
         logger.info(f"Node [ParseIncomeNode]: Sending text to LLM for analysis...")
         prompt = f"""
         Analiza el siguiente texto y extrae el monto y la descripción del ingreso.
@@ -478,35 +570,33 @@ class ParseIncomeNode(Node):
 
         Texto a analizar: "{message_text}"
         """
-        llm_response_str = call_llm(prompt)
-        logger.info(f"-> LLM response: {llm_response_str}")
-
-        try:
-            raw_income = json.loads(llm_response_str.strip().replace("```json", "").replace("```", ""))
-            today_date = datetime.now().strftime("%Y-%m-%d")
-            
-            clean_income = {
-                "date": today_date, "who": user_name, "chat_id": chat_id,
-                "amount": raw_income.get("amount"),
-                "description": raw_income.get("description", "Sin descripción"),
-                "category": "Ingreso",
-                "type": "Ingreso"
-            }
-            return [clean_income]
-        except (json.JSONDecodeError, TypeError):
-            logger.error("-> Error: LLM response is not valid JSON.")
+        raw_income = await call_llm_json_async(prompt, INCOME_SCHEMA, cache_text=message_text)
+        logger.info(f"-> LLM response: {raw_income}")
+        if raw_income is None:
+            logger.error("-> Error: LLM did not return a valid income.")
             return []
+        return [clean_income(raw_income, user_name, chat_id)]
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         if exec_res: shared["parsed_transactions"] = exec_res
         return "default"
 
-class ParseBudgetNode(Node):
-    def prep(self, shared):
-        return shared.get("telegram_input", {}).get("message_text")
+class ParseBudgetNode(AsyncNode):
+    async def prep_async(self, shared):
+        return {
+            "message_text": shared.get("telegram_input", {}).get("message_text"),
+            "entities": shared.get("user_intent", {}).get("entities", {})
+        }
 
-    def exec(self, message_text):
+    async def exec_async(self, prep_data):
+        message_text = prep_data.get("message_text")
         if not message_text: return None
+
+        entities = prep_data.get("entities", {})
+        if entities.get("category") and entities.get("amount") is not None:
+            logger.info("Node [ParseBudgetNode]: Using budget details extracted with the intent.")
+            return {"category": entities["category"], "amount": entities["amount"]}
+
         logger.info("Node [ParseBudgetNode]: Extracting budget details...")
 
         prompt = f"""
@@ -521,28 +611,26 @@ class ParseBudgetNode(Node):
 
         Texto a analizar: "{message_text}"
         """
-        llm_response_str = call_llm(prompt)
-        logger.info(f"-> LLM budget parse response: {llm_response_str}")
-        try:
-            return json.loads(llm_response_str.strip().replace("```json", "").replace("```", ""))
-        except (json.JSONDecodeError, TypeError):
+        budget_details = await call_llm_json_async(prompt, BUDGET_SCHEMA, cache_text=message_text)
+        logger.info(f"-> LLM budget parse response: {budget_details}")
+        if budget_details is None:
             logger.error("-> Error: Could not parse budget details from LLM response.")
-            return None
+        return budget_details
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         if exec_res and "category" in exec_res and "amount" in exec_res:
             shared["budget_details"] = exec_res
             return "default"
         return None
 
-class SetBudgetNode(Node):
-    def prep(self, shared):
+class SetBudgetNode(AsyncNode):
+    async def prep_async(self, shared):
         return {
             "budget_details": shared.get("budget_details"),
             "chat_id": shared.get("telegram_input", {}).get("chat_id")
         }
 
-    def exec(self, prep_data):
+    async def exec_async(self, prep_data):
         budget_details = prep_data.get("budget_details")
         chat_id = prep_data.get("chat_id")
 
@@ -553,25 +641,24 @@ class SetBudgetNode(Node):
         amount = budget_details["amount"]
 
         logger.info(f"Node [SetBudgetNode]: Setting budget for '{category}'...")
-        success = set_budget(category.capitalize(), float(amount))
+        success = await asyncio.to_thread(set_budget, category.capitalize(), float(amount))
 
         if success:
             message = f"✅ Presupuesto actualizado!\nCategoría: {category.capitalize()}\nMonto Máximo: {float(amount):,.2f} PESOS"
         else:
             message = "❌ Hubo un error al guardar tu presupuesto. Inténtalo de nuevo."
         
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(send_message(chat_id, message))
+        await send_message(chat_id, message)
         return "done"
 
-class QueryBudgetNode(Node):
-    def prep(self, shared):
+class QueryBudgetNode(AsyncNode):
+    async def prep_async(self, shared):
         return {
             "user_intent": shared.get("user_intent", {}),
             "chat_id": shared.get("telegram_input", {}).get("chat_id")
         }
 
-    def exec(self, prep_data):
+    async def exec_async(self, prep_data):
         user_intent = prep_data.get("user_intent")
         chat_id = prep_data.get("chat_id")
 
@@ -584,14 +671,13 @@ class QueryBudgetNode(Node):
 
         logger.info(f"Node [QueryBudgetNode]: Querying budget for category '{category}'...")
         
-        budgets = get_budgets()
+        budgets = await asyncio.to_thread(get_budgets)
         budget_amount = budgets.get(category.lower())
 
         if not budget_amount:
             return f"No tienes un presupuesto definido para la categoría '{category.capitalize()}'."
 
-        all_records = get_all_records("Gastos")
-        spent_amount = calculate_monthly_spend(category.lower(), all_records)
+        spent_amount = await asyncio.to_thread(calculate_monthly_spend, category.lower())
         remaining_amount = budget_amount - spent_amount
         
         percentage = (spent_amount / budget_amount) * 100 if budget_amount > 0 else 0
@@ -605,114 +691,110 @@ class QueryBudgetNode(Node):
             f" **Te quedan: {remaining_amount:,.2f} PESOS**"
         )
         
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(send_message(chat_id, message))
+        await send_message(chat_id, message)
         return "done"
 
-    def post(self, shared, _, exec_res):
+    async def post_async(self, shared, _, exec_res):
         return None
 
-class ProcessTransactionBatchNode(BatchNode):
-    def prep(self, shared):
+class ProcessTransactionBatchNode(AsyncNode):
+    """
+    Saves every transaction of a message in one sheet write, sends one combined
+    confirmation and then any budget alerts the new expenses triggered.
+    """
+    async def prep_async(self, shared):
         return shared.get("parsed_transactions", [])
 
-    def exec(self, transaction_item):
-        chat_id = transaction_item.get("chat_id")
-        if not chat_id: return
-
-        logger.info(f"Node [ProcessTransactionBatchNode]: Processing transaction -> {transaction_item['description']}")
-        sheet_data = [transaction_item.get(k) for k in ["date", "amount", "category", "description", "who", "type"]]
-        
-        if not append_row(sheet_data):
-            logger.error("-> Error saving to Google Sheets.")
-            return
-
-        trans_type = transaction_item.get("type", "Gasto")
-        if trans_type == "Gasto":
-            confirmation_message = (f"Gasto Registrado ✅\n"
-                                  f"Monto: {transaction_item.get('amount', 0.0)} PESOS\n"
-                                  f"Categoría: {transaction_item.get('category', 'N/A')}")
-        else:
-            confirmation_message = (f"Ingreso Registrado 💸\n"
-                                  f"Monto: {transaction_item.get('amount', 0.0)} PESOS\n"
-                                  f"Descripción: {transaction_item.get('description', 'N/A')}")
-        
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(send_message(chat_id, confirmation_message))
+    async def exec_async(self, transactions):
+        transactions = [t for t in (transactions or []) if t.get("chat_id")]
+        if not transactions: return
+        chat_id = transactions[0]["chat_id"]
+
+        logger.info(f"Node [ProcessTransactionBatchNode]: Saving {len(transactions)} transactions...")
+        rows = [[t.get(k) for k in ["date", "amount", "category", "description", "who", "type"]] for t in transactions]
+        results = await asyncio.to_thread(ledger.append_many, rows)
+
+        saved = [t for t, ok in zip(transactions, results) if ok]
+        failed = [t for t, ok in zip(transactions, results) if not ok]
+        if failed:
+            logger.error(f"-> Error saving {len(failed)} of {len(transactions)} transactions to Google Sheets.")
+
+        confirmation_parts = []
+        for transaction_item in saved:
+            if transaction_item.get("type", "Gasto") == "Gasto":
+                confirmation_parts.append(f"Gasto Registrado ✅\n"
+                                          f"Monto: {transaction_item.get('amount', 0.0)} PESOS\n"
+                                          f"Categoría: {transaction_item.get('category', 'N/A')}")
+            else:
+                confirmation_parts.append(f"Ingreso Registrado 💸\n"
+                                          f"Monto: {transaction_item.get('amount', 0.0)} PESOS\n"
+                                          f"Descripción: {transaction_item.get('description', 'N/A')}")
+        if failed:
+            descriptions = ", ".join(str(t.get("description", "N/A")) for t in failed)
+            confirmation_parts.append(f"❌ No pude guardar: {descriptions}. Inténtalo de nuevo.")
+
+        # The confirmation goes out while the budgets are being checked.
+        confirmation = asyncio.create_task(send_message(chat_id, "\n\n".join(confirmation_parts)))
+
+        # Several expenses of one message can share a category; check each budget once.
+        added_by_category = defaultdict(float)
+        for transaction_item in saved:
+            if transaction_item.get("type", "Gasto") == "Gasto":
+                added_by_category[transaction_item.get("category", "").lower()] += float(transaction_item.get("amount", 0))
+
+        alert_messages = []
+        try:
+            if added_by_category:
+                budgets = await asyncio.to_thread(get_budgets)
+                for category, added_amount in added_by_category.items():
+                    alert_message = await asyncio.to_thread(build_budget_alert, category, added_amount, budgets.get(category))
+                    if alert_message:
+                        alert_messages.append(alert_message)
+        finally:
+            await confirmation
         logger.info(f"-> Confirmation sent to {chat_id}.")
+        for alert_message in alert_messages:
+            logger.info(f"-> Sending budget alert to {chat_id}.")
+            await send_message(chat_id, alert_message)
 
-        if trans_type == "Gasto":
-            category = transaction_item.get("category", "").lower()
-            current_amount = float(transaction_item.get("amount", 0))
-            
-            budgets = get_budgets()
-            budget_amount = budgets.get(category)
-
-            if budget_amount:
-                logger.info(f"-> Budget found for '{category}': {budget_amount}. Checking status...")
-                
-                all_records = get_all_records("Gastos")
-                total_spent_this_month = calculate_monthly_spend(category, all_records)
-                spent_before_this = total_spent_this_month - current_amount
-                
-                logger.info(f"-> Budget Check: Spent before={spent_before_this}, Spent now={total_spent_this_month}, Budget={budget_amount}")
-                
-                percentage_before = (spent_before_this / budget_amount) * 100 if budget_amount > 0 else 0
-                percentage_after = (total_spent_this_month / budget_amount) * 100 if budget_amount > 0 else 0
-                
-                alert_message = None
-                
-                # Case 1: You just crossed 100%
-                if percentage_after >= 100 and percentage_before < 100:
-                    alert_message = (f"🚨 ¡Alerta de Presupuesto! 🚨\n"
-                                     f"Acabas de superar el 100% de tu presupuesto para '{category.capitalize()}'.\n"
-                                     f"Gastado este mes: {total_spent_this_month:,.2f} de {budget_amount:,.2f} PESOS.")
-                # Case 2: You were already over 100% and are spending more
-                elif percentage_after > 100 and percentage_before >= 100:
-                    alert_message = (f"🚨 ¡Sigues por encima del presupuesto! 🚨\n"
-                                     f"Nuevo gasto en '{category.capitalize()}' mientras estás sobre el límite.\n"
-                                     f"Gastado este mes: {total_spent_this_month:,.2f} de {budget_amount:,.2f} PESOS.")
-                # Case 3: You just crossed 85%
-                elif percentage_after >= 85 and percentage_before < 85:
-                    alert_message = (f"⚠️ ¡Atención! ⚠️\n"
-                                     f"Ya has utilizado más del 85% de tu presupuesto para '{category.capitalize()}'.\n"
-                                     f"Gastado este mes: {total_spent_this_month:,.2f} de {budget_amount:,.2f} PESOS.")
-                
-                if alert_message:
-                    logger.info(f"-> Sending budget alert to {chat_id}.")
-                    loop.run_until_complete(send_message(chat_id, alert_message))
-
-class FetchSheetDataNode(Node):
-    def exec(self, _):
-        logger.info("Node [FetchSheetDataNode]: Reading data from Google Sheet...")
-        records = get_all_records()
-        logger.info(f"-> Found {len(records)} total records.")
-        return records
-    def post(self, shared, _, exec_res):
-        shared["sheet_data"] = exec_res
+class FetchSheetDataNode(AsyncNode):
+    async def prep_async(self, shared):
+        return shared.get("user_intent", {}).get("entities", {})
+
+    async def exec_async(self, entities):
+        logger.info("Node [FetchSheetDataNode]: Summarizing the period from the ledger...")
+        try:
+            date_range = parse_date_range(entities)
+        except ValueError:
+            date_range = None
+        if not date_range:
+            return None
+        summary = await asyncio.to_thread(ledger.summarize, *date_range)
+        logger.info(f"-> Found {summary.count} records in the period.")
+        return summary
+
+    async def post_async(self, shared, _, exec_res):
+        shared["period_summary"] = exec_res
         return "default"
 
 class FormatSummaryNode(Node):
     def prep(self, shared):
-        return {"records": shared.get("sheet_data", []), "intent": shared.get("user_intent", {})}
+        return {"summary": shared.get("period_summary"), "intent": shared.get("user_intent", {})}
 
     def exec(self, prep_data):
-        logger.info("Node [FormatSummaryNode]: Calculating and formatting summary...")
-        records = prep_data["records"]
+        logger.info("Node [FormatSummaryNode]: Formatting summary...")
+        summary = prep_data["summary"]
         entities = prep_data.get("intent", {}).get("entities", {})
         
-        if not records:
+        if (summary is None or not summary.count) and not len(ledger):
             return "No tienes transacciones registradas todavía."
 
         start_date_str = entities.get("start_date")
         end_date_str = entities.get("end_date")
 
-        if not all([start_date_str, end_date_str]):
-            return "No pude entender el rango de fechas para el resumen. Por favor, intenta de nuevo."
-
         try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            if not parse_date_range(entities):
+                return "No pude entender el rango de fechas para el resumen. Por favor, intenta de nuevo."
         except ValueError:
             return "Recibí un formato de fecha inválido. Por favor, intenta de nuevo."
 
@@ -720,41 +802,31 @@ class FormatSummaryNode(Node):
         if start_date_str == end_date_str:
             title_period = f"para el día {start_date_str}"
 
-        date_filtered_records = [
-            r for r in records 
-            if r.get("Fecha") and start_date <= datetime.strptime(r["Fecha"], "%Y-%m-%d").date() <= end_date
-        ]
-
-        if not date_filtered_records:
+        if summary is None or not summary.count:
             return f"No se encontraron transacciones en el período {title_period}."
 
-        expense_records = [r for r in date_filtered_records if r.get('Tipo') == 'Gasto']
-        income_records = [r for r in date_filtered_records if r.get('Tipo') == 'Ingreso']
-
-        total_spent = sum(float(r.get('Monto', 0)) for r in expense_records)
-        total_earned = sum(float(r.get('Monto', 0)) for r in income_records)
-        balance = total_earned - total_spent
+        balance = summary.earned - summary.spent
 
         summary_lines = [f"📊 Resumen de Finanzas {title_period}", "-----------------------------------"]
-        summary_lines.append(f"💸 Total Ingresado: {total_earned:,.2f} PESOS")
-        summary_lines.append(f"💰 Total Gastado: {total_spent:,.2f} PESOS")
+        summary_lines.append(f"💸 Total Ingresado: {summary.earned:,.2f} PESOS")
+        summary_lines.append(f"💰 Total Gastado: {summary.spent:,.2f} PESOS")
         summary_lines.append(f"⚖️ Balance Final: {balance:,.2f} PESOS\n")
 
-        if income_records:
+        if summary.by_source:
             summary_lines.append("Detalle de Ingresos:")
             by_source = defaultdict(float)
-            for r in income_records:
-                by_source[r.get('Descripcion', 'sin descripcion')] += float(r.get('Monto', 0))
+            for source, amount in summary.by_source.items():
+                by_source[source or 'sin descripcion'] += amount
             sorted_sources = sorted(by_source.items(), key=lambda item: item[1], reverse=True)
             for source, amount in sorted_sources:
                 summary_lines.append(f"  - {source.capitalize()}: {amount:,.2f} PESOS")
             summary_lines.append("")
         
-        if expense_records:
+        if summary.by_category:
             summary_lines.append("Detalle de Gastos por Categoría:")
             by_category = defaultdict(float)
-            for r in expense_records:
-                by_category[r.get('Categoria', 'sin categoria')] += float(r.get('Monto', 0))
+            for category, amount in summary.by_category.items():
+                by_category[category or 'sin categoria'] += amount
             sorted_categories = sorted(by_category.items(), key=lambda item: item[1], reverse=True)
             for category, amount in sorted_categories:
                 summary_lines.append(f"  - {category.capitalize()}: {amount:,.2f} PESOS")
@@ -768,12 +840,11 @@ class FormatSummaryNode(Node):
         return "default"
 
 
-class SendSummaryNode(Node):
-    def prep(self, shared):
+class SendSummaryNode(AsyncNode):
+    async def prep_async(self, shared):
         return {"chat_id": shared.get("telegram_input", {}).get("chat_id"), "message": shared.get("summary_message")}
-    def exec(self, prep_data):
+    async def exec_async(self, prep_data):
         chat_id, message = prep_data["chat_id"], prep_data["message"]
         if not all([chat_id, message]): return
         logger.info("Node [SendSummaryNode]: Sending summary to the user.")
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(send_message(chat_id, message))
\ No newline at end of file
+        await send_message(chat_id, message)
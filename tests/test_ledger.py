@@ -0,0 +1,103 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from utils import ledger as ledger_module
+from utils.gsheets_api import DEFAULT_HEADERS
+from utils.journal import AppendJournal
+from utils.ledger import Ledger
+
+class FakeSheet:
+    """
+    In-memory sheet behind the three gsheets_api calls the ledger makes.
+    report_positions=False mimics an append response without updatedRange.
+    """
+    def __init__(self, rows: list):
+        self.rows = [list(DEFAULT_HEADERS)] + rows
+        self.report_positions = True
+        self.before_append = None
+        self._lock = threading.Lock()
+
+    def append_rows(self, rows, sheet_name="Gastos"):
+        if self.before_append:
+            self.before_append()
+        with self._lock:
+            first_row = len(self.rows) + 1
+            self.rows.extend([str(value) for value in row] for row in rows)
+        positions = [first_row + offset if self.report_positions else None for offset in range(len(rows))]
+        return [True] * len(rows), positions
+
+    def get_sheet_values(self, sheet_name="Gastos"):
+        with self._lock:
+            return [list(row) for row in self.rows]
+
+    def get_rows_from(self, start_row, sheet_name="Gastos", width=None):
+        with self._lock:
+            return [list(row) for row in self.rows[start_row - 1:]]
+
+class LedgerJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.sheet = FakeSheet([["2024-05-01", "50", "auto", "nafta", "ana", "Gasto"]])
+        for name in ("append_rows", "get_sheet_values", "get_rows_from"):
+            patcher = mock.patch.object(ledger_module, name, getattr(self.sheet, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal = AppendJournal(os.path.join(directory.name, "journal.sqlite3"), "Gastos")
+        self.journal.enqueue([["2024-05-02", 100, "auto", "service", "ana", "Gasto"]])
+        self.ledger = Ledger("Gastos", journal=self.journal)
+
+    def assert_counted_once(self):
+        self.assertEqual(len(self.ledger), 2)
+        self.assertEqual(self.ledger.monthly_spend("auto", 2024, 5), 150.0)
+
+    def test_reload_right_after_a_flush_counts_the_batch_once(self):
+        self.ledger.refresh()
+
+        def write_then_reload(rows, on_written):
+            results = self.ledger.write_rows(rows, on_written)
+            # The lock is free again: a load now must not find the rows pending too.
+            with self.ledger._lock:
+                self.ledger._load()
+            return results
+
+        self.assertTrue(self.journal.flush_once(write_then_reload))
+        self.assertEqual(self.journal.pending_rows(), [])
+        self.assert_counted_once()
+
+    def test_reload_after_an_untracked_append_counts_the_batch_once(self):
+        self.ledger.refresh()
+        self.sheet.report_positions = False
+        self.assertTrue(self.journal.flush_once(self.ledger.write_rows))
+        self.assertIsNone(self.ledger._headers)
+        self.assert_counted_once()
+
+    def test_first_load_waits_for_leftover_rows_being_flushed(self):
+        appending, release = threading.Event(), threading.Event()
+
+        def block_append():
+            appending.set()
+            release.wait(5)
+
+        self.sheet.before_append = block_append
+        self.ledger.start_write_behind()
+        self.addCleanup(self.ledger.stop_write_behind)
+        self.addCleanup(release.set)
+        self.assertTrue(appending.wait(5))
+
+        warm_up = threading.Thread(target=self.ledger.refresh)
+        warm_up.start()
+        warm_up.join(0.2)
+        # Still waiting for the leftover row to land instead of leaving the ledger empty.
+        self.assertTrue(warm_up.is_alive())
+        release.set()
+        warm_up.join(5)
+        self.assertFalse(warm_up.is_alive())
+        self.assertIsNotNone(self.ledger._headers)
+        self.assert_counted_once()
+        self.assertEqual(self.journal.pending_rows(), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Holds a single value loaded through `loader` and reloads it once `ttl`
+    seconds have passed. If a reload fails (the loader returns None) the stale
+    value keeps being served. Hits and misses are counted for monitoring.
+    """
+    def __init__(self, name: str, loader, ttl: float):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        """
+        Returns the cached value, loading it first if it is missing or expired.
+        """
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            value = self.loader()
+            if value is not None:
+                self._value = value
+                self._loaded_at = time.monotonic()
+            return self._value
+
+    def update(self, mutate):
+        """
+        Applies a write-through change to the cached value, if one is loaded.
+        """
+        with self._lock:
+            if self._value is not None:
+                mutate(self._value)
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = 0.0
+
+class SingleFlight:
+    """
+    Concurrent callers with the same key share one in-flight call and its
+    result (or exception). A successful result is also handed to callers
+    arriving within `fresh_for` seconds after it finished, unless forget()
+    drops it first.
+    """
+    def __init__(self, fresh_for: float = 0.0):
+        self.fresh_for = fresh_for
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._recent = {}
+        self.shared = 0
+        self.reused = 0
+
+    def do(self, key, function):
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None and time.monotonic() - recent.finished_at < self.fresh_for:
+                self.reused += 1
+                return recent.result
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # forget() may already have dropped it; only remove our own call.
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                    if call.error is None and self.fresh_for > 0:
+                        call.finished_at = time.monotonic()
+                        self._recent[key] = call
+            call.done.set()
+
+    def forget(self, matches):
+        """
+        Drops the in-flight and recent results whose key satisfies matches(key),
+        so the next caller fetches again (e.g. after a write).
+        """
+        with self._lock:
+            for calls in (self._calls, self._recent):
+                for key in [key for key in calls if matches(key)]:
+                    del calls[key]
+
+    def stats(self) -> dict:
+        return {"shared": self.shared, "reused": self.reused}
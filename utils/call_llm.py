@@ -1,65 +1,300 @@
+import io
 import os
+import re
+import time
+import random
+import asyncio
 import logging
-import time 
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
+import threading
+import contextlib
+from utils import config
+from utils.llm_cache import response_cache, make_key
+from utils.schemas import parse_json
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in the .env file")
+MODEL_NAME = "gemini-2.0-flash"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+MAX_BACKOFF_SECONDS = 60
+# Gemini accepts up to 20 MB per request; leave room for the prompt.
+INLINE_AUDIO_MAX_BYTES = 18 * 1024 * 1024
+
+_genai_module = None
+_models = {}
+_models_lock = threading.Lock()
+# One budget for every request, whether it comes from the event loop or from a worker thread.
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+SLOT_POLL_SECONDS = 0.02
+# Set when the API asks us to slow down, so every caller waits, not just the one that got the 429.
+_cooldown_until = 0.0
+
+@contextlib.asynccontextmanager
+async def _async_slot():
+    """
+    Takes one of the LLM_MAX_CONCURRENCY slots shared with the sync callers.
+    It polls instead of blocking, so neither the event loop nor a worker
+    thread is held while waiting, and a cancelled wait leaves nothing behind.
+    """
+    while not _slots.acquire(blocking=False):
+        await asyncio.sleep(SLOT_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        _slots.release()
+
+def _genai():
+    """
+    Imports and configures google.generativeai on first use. It is the slowest
+    import in the bot, and most messages never reach the LLM.
+    """
+    global _genai_module
+    if _genai_module is None:
+        import google.generativeai as genai
+
+        genai.configure(api_key=config.GEMINI_API_KEY)
+        _genai_module = genai
+    return _genai_module
+
+def get_model(model_name: str = MODEL_NAME) -> "genai.GenerativeModel":
+    """
+    Returns the shared GenerativeModel for model_name, creating it on first use.
+    """
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _genai().GenerativeModel(model_name)
+            _models[model_name] = model
+        return model
+
+def _is_rate_limited(error: Exception) -> bool:
+    message = str(error)
+    return "429" in message or "ResourceExhausted" in type(error).__name__ or "503" in message
 
-genai.configure(api_key=GEMINI_API_KEY)
+def _retry_after(error: Exception):
+    """
+    Extracts the server-suggested wait (Retry-After header or RetryInfo delay), in seconds.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("Retry-After", "").isdigit():
+        return float(headers["Retry-After"])
+    match = re.search(r"retry[_ -]?(?:delay|after)\D{0,20}?(\d+(?:\.\d+)?)", str(error), re.IGNORECASE)
+    return float(match.group(1)) if match else None
 
-def call_llm(prompt: str, max_retries: int = 3) -> str:
+def _backoff_delay(error: Exception, attempt: int) -> float:
+    """
+    Exponential backoff with full jitter, never shorter than what the server asked for.
+    """
+    delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, 2 ** (attempt + 1)))
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def _start_cooldown(delay: float):
+    global _cooldown_until
+    _cooldown_until = max(_cooldown_until, time.monotonic() + delay)
+
+def _cached_response(prompt: str, cache_text: str):
+    if not cache_text:
+        return None, None
+    cache_key = make_key(prompt, cache_text)
+    return cache_key, response_cache.get(cache_key)
+
+def _generation_config(response_schema: dict = None):
+    if response_schema is None:
+        return None
+    return _genai().GenerationConfig(response_mime_type="application/json", response_schema=response_schema)
+
+@traced("llm")
+def call_llm(prompt: str, max_retries: int = 3, cache_text: str = None, response_schema: dict = None) -> str:
     """
     Calls the language model to process the prompt, with retry logic.
+    When cache_text (the user's message inside the prompt) is given, responses
+    are memoized by that text, the prompt template and today's date.
+    With response_schema the model is asked for JSON matching that schema.
     """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    attempts = 0
-    while attempts < max_retries:
+    cache_key, cached_response = _cached_response(prompt, cache_text)
+    if cached_response is not None:
+        logger.info("-> LLM response served from cache.")
+        return cached_response
+
+    model = get_model()
+    for attempt in range(max_retries):
+        wait_time = _cooldown_until - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
         try:
-            response = model.generate_content(prompt)
+            with _slots:
+                response = model.generate_content(prompt, generation_config=_generation_config(response_schema))
+            if cache_key and response.text:
+                response_cache.put(cache_key, response.text)
             return response.text
         except Exception as e:
-            if "429" in str(e):
-                attempts += 1
-                wait_time = 5 * attempts 
-                logger.info(f"-> API rate limit hit (429). Retrying in {wait_time} seconds... ({attempts}/{max_retries})")
-                time.sleep(wait_time)
-            else:
+            if not _is_rate_limited(e):
                 logger.error(f"Error calling LLM: {e}")
                 return ""
+            wait_time = _backoff_delay(e, attempt)
+            _start_cooldown(wait_time)
+            logger.info(f"-> API rate limit hit (429). Retrying in {wait_time:.1f} seconds... ({attempt + 1}/{max_retries})")
     
     logger.warning("-> Maximum number of retries for the LLM API exceeded.")
     return ""
 
-def transcribe_audio_with_llm(audio_path: str) -> str:
+@traced("llm")
+async def call_llm_async(prompt: str, max_retries: int = 3, cache_text: str = None, response_schema: dict = None) -> str:
     """
-    Uploads an audio file and asks the multimodal LLM to transcribe it.
+    Async version of call_llm. At most LLM_MAX_CONCURRENCY requests are in
+    flight at once, and a 429 makes every caller back off together.
     """
-    logger.info(f"Uploading audio file: {audio_path} to Gemini...")
-    model = genai.GenerativeModel('gemini-2.0-flash') 
-    
+    cache_key, cached_response = _cached_response(prompt, cache_text)
+    if cached_response is not None:
+        logger.info("-> LLM response served from cache.")
+        return cached_response
+
+    model = get_model()
+    for attempt in range(max_retries):
+        wait_time = _cooldown_until - time.monotonic()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        try:
+            async with _async_slot():
+                response = await model.generate_content_async(prompt, generation_config=_generation_config(response_schema))
+            if cache_key and response.text:
+                response_cache.put(cache_key, response.text)
+            return response.text
+        except Exception as e:
+            if not _is_rate_limited(e):
+                logger.error(f"Error calling LLM: {e}")
+                return ""
+            wait_time = _backoff_delay(e, attempt)
+            _start_cooldown(wait_time)
+            logger.info(f"-> API rate limit hit (429). Retrying in {wait_time:.1f} seconds... ({attempt + 1}/{max_retries})")
+
+    logger.warning("-> Maximum number of retries for the LLM API exceeded.")
+    return ""
+
+def _repair_prompt(prompt: str, response_str: str, errors: list) -> str:
+    return (
+        f"{prompt}\n\n"
+        f"Tu respuesta anterior no cumplía el formato pedido:\n{response_str}\n"
+        f"Errores: {'; '.join(errors)}\n"
+        "Responde de nuevo ÚNICAMENTE con el JSON corregido."
+    )
+
+def call_llm_json(prompt: str, schema: dict, cache_text: str = None):
+    """
+    Calls the LLM in JSON mode and validates the answer against schema.
+    An invalid answer gets one repair request quoting the errors.
+    Returns the parsed data, or None if it is still invalid. Only valid
+    answers are cached.
+    """
+    cache_key, cached_response = _cached_response(prompt, cache_text)
+    if cached_response is not None:
+        data, errors = parse_json(cached_response, schema)
+        if not errors:
+            logger.info("-> LLM response served from cache.")
+            return data
+
+    response_str = call_llm(prompt, response_schema=schema)
+    data, errors = parse_json(response_str, schema)
+    if errors and response_str:
+        logger.warning(f"-> LLM response failed validation ({'; '.join(errors)}). Asking for a repair...")
+        response_str = call_llm(_repair_prompt(prompt, response_str, errors), response_schema=schema)
+        data, errors = parse_json(response_str, schema)
+    if errors:
+        logger.error(f"-> LLM response is still invalid: {'; '.join(errors)}")
+        return None
+    if cache_key:
+        response_cache.put(cache_key, response_str)
+    return data
+
+async def call_llm_json_async(prompt: str, schema: dict, cache_text: str = None):
+    """
+    Async version of call_llm_json.
+    """
+    cache_key, cached_response = _cached_response(prompt, cache_text)
+    if cached_response is not None:
+        data, errors = parse_json(cached_response, schema)
+        if not errors:
+            logger.info("-> LLM response served from cache.")
+            return data
+
+    response_str = await call_llm_async(prompt, response_schema=schema)
+    data, errors = parse_json(response_str, schema)
+    if errors and response_str:
+        logger.warning(f"-> LLM response failed validation ({'; '.join(errors)}). Asking for a repair...")
+        response_str = await call_llm_async(_repair_prompt(prompt, response_str, errors), response_schema=schema)
+        data, errors = parse_json(response_str, schema)
+    if errors:
+        logger.error(f"-> LLM response is still invalid: {'; '.join(errors)}")
+        return None
+    if cache_key:
+        response_cache.put(cache_key, response_str)
+    return data
+
+def _convert_to_wav(audio_bytes: bytes) -> bytes:
+    """
+    Decodes the audio with pydub/ffmpeg and re-encodes it as WAV, in memory.
+    """
+    from pydub import AudioSegment
+
+    wav_buffer = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(audio_bytes)).export(wav_buffer, format="wav")
+    return wav_buffer.getvalue()
+
+def _audio_part(audio_bytes: bytes, mime_type: str):
+    """
+    Small clips go inline with the request; larger ones through the Files API,
+    streamed from memory.
+    """
+    if len(audio_bytes) <= INLINE_AUDIO_MAX_BYTES:
+        return {"mime_type": mime_type, "data": audio_bytes}
+    return _genai().upload_file(io.BytesIO(audio_bytes), mime_type=mime_type)
+
+def _generate_with_retries(model, contents, max_retries: int = 3):
+    """
+    generate_content with the same shared 429 backoff as call_llm; other errors are raised.
+    """
+    for attempt in range(max_retries):
+        wait_time = _cooldown_until - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        try:
+            with _slots:
+                return model.generate_content(contents)
+        except Exception as e:
+            if not _is_rate_limited(e) or attempt == max_retries - 1:
+                raise
+            wait_time = _backoff_delay(e, attempt)
+            _start_cooldown(wait_time)
+            logger.info(f"-> API rate limit hit (429). Retrying in {wait_time:.1f} seconds... ({attempt + 1}/{max_retries})")
+
+@traced("llm")
+def transcribe_audio_with_llm(audio_bytes: bytes, mime_type: str = "audio/ogg") -> str:
+    """
+    Asks the multimodal LLM to transcribe a voice note. The original Opus bytes
+    are sent as they are; only if the model rejects them is the audio converted
+    to WAV and sent again.
+    """
+    logger.info(f"Transcribing {len(audio_bytes)} bytes of {mime_type} audio with Gemini...")
+    model = get_model()
+    prompt = "Transcribe este audio a texto. Responde únicamente con el texto transcrito."
+
+    try:
+        response = _generate_with_retries(model, [prompt, _audio_part(audio_bytes, mime_type)])
+        return response.text.strip()
+    except Exception as e:
+        if _is_rate_limited(e):
+            logger.error(f"Error during audio transcription: {e}")
+            return ""
+        logger.warning(f"-> Transcription of the original audio failed ({e}). Retrying as WAV...")
+
     try:
-        # 1. Upload the file to the Gemini API
-        audio_file = genai.upload_file(path=audio_path)
-        logger.info("-> Audio file uploaded successfully.")
-        
-        # 2. Send the file and a prompt to the model
-        prompt = "Transcribe este audio a texto. Responde únicamente con el texto transcrito."
-        response = model.generate_content([prompt, audio_file])
-        
-        # 3. Clean up the local audio file after processing
-        os.remove(audio_path)
-        
+        wav_bytes = _convert_to_wav(audio_bytes)
+        response = _generate_with_retries(model, [prompt, _audio_part(wav_bytes, "audio/wav")])
         return response.text.strip()
     except Exception as e:
         logger.error(f"Error during audio transcription: {e}")
-        # Clean up the file even if there's an error
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-        return ""
\ No newline at end of file
+        return ""
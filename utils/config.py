@@ -0,0 +1,52 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
+SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE", "service_account.json")
+
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()
+POLL_TIMEOUT = int(os.getenv("TELEGRAM_POLL_TIMEOUT", "50"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# "gemini" (default) or "whisper" (local faster-whisper model, Gemini as fallback).
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "gemini").lower()
+
+# TRACING=0 turns off node and external-call timing entirely.
+TRACING_ENABLED = os.getenv("TRACING", "1") != "0"
+TRACE_SLOW_MESSAGE_SECONDS = float(os.getenv("TRACE_SLOW_MESSAGE_SECONDS", "5"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+def validate():
+    """
+    Checks every required setting at once, so a bad deploy fails at startup
+    with the full list of problems instead of on the first message.
+    """
+    problems = []
+    if not TELEGRAM_TOKEN:
+        problems.append("TELEGRAM_TOKEN not found in .env file.")
+    if not GEMINI_API_KEY:
+        problems.append("GEMINI_API_KEY not found in .env file.")
+    if not GOOGLE_SHEET_ID:
+        problems.append("GOOGLE_SHEET_ID not found in .env file.")
+    if not os.path.isfile(SERVICE_ACCOUNT_FILE):
+        problems.append(f"Service account credentials '{SERVICE_ACCOUNT_FILE}' not found.")
+    if TELEGRAM_MODE not in ("polling", "webhook"):
+        problems.append("TELEGRAM_MODE must be 'polling' or 'webhook'.")
+    if TELEGRAM_MODE == "webhook" and not WEBHOOK_URL:
+        problems.append("WEBHOOK_URL not found in .env file (required when TELEGRAM_MODE=webhook).")
+    if TELEGRAM_MODE == "webhook" and not WEBHOOK_SECRET:
+        # Without it anyone who finds the URL can post fake updates.
+        problems.append("WEBHOOK_SECRET not found in .env file (required when TELEGRAM_MODE=webhook).")
+    if METRICS_PORT and TELEGRAM_MODE == "webhook" and METRICS_PORT == WEBHOOK_PORT:
+        problems.append("METRICS_PORT must differ from WEBHOOK_PORT.")
+    if TRANSCRIBE_BACKEND not in ("gemini", "whisper"):
+        problems.append(f"TRANSCRIBE_BACKEND must be 'gemini' or 'whisper', got '{TRANSCRIBE_BACKEND}'.")
+
+    if problems:
+        raise ValueError("Invalid configuration:\n  - " + "\n  - ".join(problems))
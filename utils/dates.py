@@ -0,0 +1,87 @@
+import re
+from datetime import date, timedelta
+from utils.text import normalize
+
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+NUMBER_WORDS = {
+    "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+    "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "quince": 15, "veinte": 20, "treinta": 30,
+}
+NUMBER = r"(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")"
+MONTH_NAME = "(" + "|".join(MONTHS) + ")"
+
+def month_bounds(day: date) -> tuple[date, date]:
+    """
+    Returns the first and last day of the month that contains `day`.
+    """
+    first = day.replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first, last
+
+def months_before(day: date, months: int) -> date:
+    """
+    Returns the first day of the month `months` months before the one containing `day`.
+    """
+    index = day.year * 12 + day.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _number(word: str) -> int:
+    return int(word) if word.isdigit() else NUMBER_WORDS[word]
+
+def _named_month(today: date, match) -> tuple[date, date]:
+    month = MONTHS[match.group(1)]
+    year_word = match.group(2)
+    if year_word and year_word.isdigit():
+        year = int(year_word)
+    elif year_word == "pasado":
+        year = today.year - 1 if month >= today.month else today.year
+    else:
+        # A bare month name means its most recent occurrence, the current one included.
+        year = today.year if month <= today.month else today.year - 1
+    return month_bounds(date(year, month, 1))
+
+def _explicit_range(today: date, match) -> tuple[date, date]:
+    return date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))
+
+# Longer, more specific phrases go first.
+PERIOD_PATTERNS = [
+    (re.compile(r"\b(\d{4}-\d{2}-\d{2}) (?:al|a|hasta(?: el)?) (\d{4}-\d{2}-\d{2})\b"), _explicit_range),
+    (re.compile(r"\banteayer\b"), lambda today, _: (today - timedelta(days=2),) * 2),
+    (re.compile(r"\bhoy\b"), lambda today, _: (today, today)),
+    (re.compile(r"\bayer\b"), lambda today, _: (today - timedelta(days=1),) * 2),
+    (re.compile(rf"\bultim[oa]s {NUMBER} dias\b"), lambda today, match: (today - timedelta(days=_number(match.group(1))), today)),
+    (re.compile(rf"\bultimas {NUMBER} semanas\b"), lambda today, match: (today - timedelta(weeks=_number(match.group(1))), today)),
+    (re.compile(rf"\bultimos {NUMBER} meses\b"), lambda today, match: (months_before(today, _number(match.group(1))), today)),
+    (re.compile(r"\bultima semana\b"), lambda today, _: (today - timedelta(days=7), today)),
+    (re.compile(r"\b(?:esta|la) semana\b(?! pasada)"), lambda today, _: (today - timedelta(days=today.weekday()), today)),
+    (re.compile(r"\bsemana pasada\b"), lambda today, _: (
+        today - timedelta(days=today.weekday() + 7),
+        today - timedelta(days=today.weekday() + 1),
+    )),
+    (re.compile(r"\b(?:mes pasado|ultimo mes)\b"), lambda today, _: month_bounds(months_before(today, 1))),
+    (re.compile(r"\b(?:este|el) mes\b(?! pasado)"), lambda today, _: month_bounds(today)),
+    (re.compile(r"\bano pasado\b"), lambda today, _: (date(today.year - 1, 1, 1), date(today.year - 1, 12, 31))),
+    (re.compile(r"\b(?:este|el) ano\b(?! pasado)"), lambda today, _: (date(today.year, 1, 1), date(today.year, 12, 31))),
+    (re.compile(rf"\b{MONTH_NAME}(?: (?:de |del )?(\d{{4}}|pasado))?\b"), _named_month),
+]
+
+def resolve_period(text: str, today: date = None):
+    """
+    Resolves a Spanish period expression ("hoy", "mes pasado", "ultimos 15 dias",
+    "octubre"...) against today's date. Returns (start_date, end_date, matched_phrase),
+    where the phrase is in normalized form, or None if no known period is mentioned.
+    """
+    today = today or date.today()
+    text = normalize(text)
+    for pattern, resolve in PERIOD_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            try:
+                start_date, end_date = resolve(today, match)
+            except ValueError:
+                continue
+            return start_date, end_date, match.group(0)
+    return None
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+class ChatDispatcher:
+    """
+    Runs the async flow for each incoming message on the bot's event loop, with
+    at most max_workers flows in progress at once. Messages from the same chat
+    are handled in arrival order, while different chats are processed
+    concurrently.
+    """
+    def __init__(self, flow, max_workers: int = 4, max_pending: int = 32):
+        self.flow = flow
+        self._workers = asyncio.Semaphore(max_workers)
+        self._pending = asyncio.Semaphore(max_pending)
+        self._chat_locks = {}
+        self._chat_pending = {}
+        self._tasks = set()
+
+    async def dispatch(self, shared: dict):
+        """
+        Queues one message. Waits only when too many messages are already pending.
+        """
+        await self._pending.acquire()
+        chat_id = shared.get("telegram_input", {}).get("chat_id")
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_pending[chat_id] = self._chat_pending.get(chat_id, 0) + 1
+
+        task = asyncio.create_task(self._run(chat_id, lock, shared))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, chat_id, lock: asyncio.Lock, shared: dict):
+        try:
+            # The chat lock is taken first so that waiters keep their arrival order.
+            async with lock:
+                async with self._workers:
+                    with tracing.message_trace(shared):
+                        await self.flow.run_async(shared)
+        except Exception as e:
+            logger.error(f"Error processing message for chat {chat_id}: {e}", exc_info=True)
+        finally:
+            self._pending.release()
+            self._chat_pending[chat_id] -= 1
+            if not self._chat_pending[chat_id]:
+                del self._chat_pending[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def join(self):
+        """
+        Waits until every dispatched message has been processed.
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
@@ -0,0 +1,154 @@
+import re
+import logging
+import threading
+from datetime import date
+from utils.dates import resolve_period
+from utils.text import normalize
+
+logger = logging.getLogger(__name__)
+
+# Common descriptions that unambiguously belong to a category. A keyword is only
+# used when its category exists in the user's sheet.
+CATEGORY_KEYWORDS = {
+    "super": "alimentos", "supermercado": "alimentos", "verduleria": "alimentos", "carniceria": "alimentos",
+    "cafe": "salidas", "restaurante": "salidas", "cena": "salidas", "almuerzo": "salidas", "bar": "salidas",
+    "nafta": "auto", "peaje": "auto", "estacionamiento": "auto", "seguro del auto": "auto",
+    "farmacia": "medicamentos", "remedios": "medicamentos",
+    "alquiler": "alquiler", "expensas": "expensas",
+    "veterinaria": "mascotas", "alimento del perro": "mascotas", "alimento del gato": "mascotas",
+    "luz": "servicios", "gas": "servicios", "agua": "servicios", "internet": "servicios",
+}
+
+HELP_MESSAGES = {"ayuda", "/help", "help", "/start", "que podes hacer", "que puedes hacer", "comandos"}
+
+AMOUNT = r"\$?\s?(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d{1,2}))?(\s?(?:mil|k))?(?:\s?pesos)?"
+EXPENSE_PATTERN = re.compile(rf"^(?:gaste|pague|compre)\s+{AMOUNT}\s+(?:en|de|por)\s+(?:un |una |el |la |los |las )?(.+)$")
+SUMMARY_PATTERN = re.compile(r"^(?:resumen|balance|cuanto gaste|gastos|mis gastos)\b(.*)$")
+BUDGET_QUERY_PATTERN = re.compile(
+    r"^(?:cuanto me queda (?:para|en)|como voy con el presupuesto de|presupuesto de)\s+(?:la |el )?([a-z ]+?)$"
+)
+FILLER_WORDS = {"de", "del", "en", "la", "el", "los", "las", "y", "mis", "para", "que", "hice"}
+
+class FastPathStats:
+    """
+    Counts how many messages were answered locally versus sent to the LLM.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+stats = FastPathStats()
+
+def parse_amount(integer_part: str, decimal_part: str = None, multiplier: str = None):
+    """
+    Returns the amount as an int when it is whole (like the LLM path writes it), else as a float.
+    """
+    amount = float(integer_part.replace(".", ""))
+    if decimal_part:
+        amount += float(f"0.{decimal_part}")
+    if multiplier:
+        amount *= 1000
+    amount = round(amount, 2)
+    return int(amount) if amount.is_integer() else amount
+
+def _only_filler(text: str) -> bool:
+    return all(word in FILLER_WORDS for word in text.split())
+
+def _match_categories(text: str, valid_categories: list) -> tuple[list, str]:
+    """
+    Finds the valid category names mentioned in text and returns them with the leftover text.
+    """
+    found = []
+    for category in sorted(valid_categories, key=len, reverse=True):
+        pattern = re.compile(rf"\b{re.escape(normalize(category))}\b")
+        if pattern.search(text):
+            found.append(category)
+            text = pattern.sub(" ", text)
+    return found, text
+
+def _classify_expense(text: str, valid_categories: list):
+    match = EXPENSE_PATTERN.match(text)
+    if not match:
+        return None
+    integer_part, decimal_part, multiplier, description = match.groups()
+    # Several expenses in one message are left to the LLM.
+    if re.search(r"\by\b|\d", description):
+        return None
+
+    normalized_categories = {normalize(category): category for category in valid_categories}
+    category = normalized_categories.get(description)
+    if category is None:
+        keyword_category = CATEGORY_KEYWORDS.get(description)
+        category = normalized_categories.get(keyword_category) if keyword_category else None
+    if category is None:
+        return None
+
+    amount = parse_amount(integer_part, decimal_part, multiplier)
+    if amount <= 0:
+        return None
+    expense = {"amount": amount, "category": category, "description": description}
+    return {"intent": "REGISTRAR_GASTO", "entities": {"expenses": [expense]}}
+
+def _classify_query(text: str, valid_categories: list, today: date):
+    match = SUMMARY_PATTERN.match(text)
+    if not match:
+        return None
+    rest = match.group(1)
+    period = resolve_period(rest, today)
+    if not period:
+        return None
+    start_date, end_date, phrase = period
+    rest = rest.replace(phrase, " ")
+
+    categories, rest = _match_categories(rest, valid_categories)
+    if not _only_filler(rest):
+        return None
+
+    entities = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+    if categories:
+        entities["categories"] = categories
+        return {"intent": "CONSULTAR_GASTOS_POR_CATEGORIA", "entities": entities}
+    return {"intent": "CONSULTAR_GASTOS", "entities": entities}
+
+def _classify_budget_query(text: str, valid_categories: list):
+    match = BUDGET_QUERY_PATTERN.match(text)
+    if not match:
+        return None
+    categories, rest = _match_categories(match.group(1), valid_categories)
+    if len(categories) != 1 or rest.strip():
+        return None
+    return {"intent": "CONSULTAR_PRESUPUESTO", "entities": {"category": categories[0]}}
+
+def classify(message_text: str, valid_categories: list, today: date = None):
+    """
+    Classifies common message shapes without calling the LLM.
+    Returns the same {"intent", "entities"} structure as DetectIntentNode, or
+    None when the message is not a confident match.
+    """
+    text = normalize(message_text or "")
+    today = today or date.today()
+    valid_categories = valid_categories or ["otros"]
+
+    if text in HELP_MESSAGES:
+        result = {"intent": "PEDIR_AYUDA", "entities": {}}
+    else:
+        result = (
+            _classify_expense(text, valid_categories)
+            or _classify_query(text, valid_categories, today)
+            or _classify_budget_query(text, valid_categories)
+        )
+
+    stats.record(result is not None)
+    return result
@@ -1,49 +1,182 @@
 import os
-import gspread
+import re
+import sys
 import logging
-from google.oauth2.service_account import Credentials
-from dotenv import load_dotenv
-
-load_dotenv()
+import threading
+from utils import config
+from utils.cache import TTLCache, SingleFlight
+from utils.rate_limit import SheetsRateLimiter
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
-GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-SERVICE_ACCOUNT_FILE = "service_account.json"
+GOOGLE_SHEET_ID = config.GOOGLE_SHEET_ID
+SERVICE_ACCOUNT_FILE = config.SERVICE_ACCOUNT_FILE
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file"
+]
+DEFAULT_HEADERS = ["Fecha", "Monto", "Categoria", "Descripcion", "Quien", "Tipo"]
+BUDGETS_REFRESH_SECONDS = float(os.getenv("BUDGETS_REFRESH_SECONDS", "300"))
+CATEGORIES_REFRESH_SECONDS = float(os.getenv("CATEGORIES_REFRESH_SECONDS", "300"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+# Identical reads finishing less than this many seconds apart share one download.
+SHEETS_READ_FRESH_SECONDS = float(os.getenv("SHEETS_READ_FRESH_SECONDS", "2"))
+
+def _is_auth_error(error: Exception) -> bool:
+    """
+    Tells whether an exception means the session has to be re-authorized.
+    """
+    # gspread and google-auth are imported lazily; if they are not loaded yet,
+    # the error cannot have come from them.
+    if "gspread" not in sys.modules:
+        return False
+    import gspread
+    from google.auth.exceptions import RefreshError, TransportError
+
+    if isinstance(error, (RefreshError, TransportError)):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        return getattr(error.response, "status_code", None) == 401
+    return False
+
+def _is_rate_limited(error: Exception) -> bool:
+    """
+    Tells whether an exception is Google's 429 (quota exceeded).
+    """
+    if "gspread" in sys.modules:
+        import gspread
+        if isinstance(error, gspread.exceptions.APIError):
+            return getattr(error.response, "status_code", None) == 429
+    return "429" in str(error)
+
+class SheetsClientManager:
+    """
+    Process-wide holder of the authorized client, the spreadsheet and its worksheets.
+    The authorized session refreshes its token on its own, so after the first
+    call only the data request itself reaches the network. The session is
+    rebuilt only when Google rejects it.
+    Every request first takes a token from the shared quota limiter.
+    """
+    def __init__(self, sheet_id: str, service_account_file: str, limiter: SheetsRateLimiter = None):
+        self.sheet_id = sheet_id
+        self.service_account_file = service_account_file
+        self.limiter = limiter or SheetsRateLimiter()
+        self._reads = SingleFlight(fresh_for=SHEETS_READ_FRESH_SECONDS)
+        self._lock = threading.RLock()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+
+    def client(self) -> "gspread.Client":
+        with self._lock:
+            if self._client is None:
+                # Imported here so the bot can start polling before these load.
+                import gspread
+                from google.oauth2.service_account import Credentials
+
+                creds = Credentials.from_service_account_file(
+                    self.service_account_file, scopes=SCOPES
+                )
+                self._client = gspread.authorize(creds)
+                logger.info("-> Google Sheets client authorized.")
+            return self._client
+
+    def spreadsheet(self) -> "gspread.Spreadsheet":
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.client().open_by_key(self.sheet_id)
+            return self._spreadsheet
 
-if not GOOGLE_SHEET_ID:
-    raise ValueError("GOOGLE_SHEET_ID not found in the .env file")
+    def worksheet(self, sheet_name: str, create_headers: list = None) -> "gspread.Worksheet":
+        """
+        Returns the cached worksheet, creating it with the given headers if it does not exist.
+        """
+        with self._lock:
+            worksheet = self._worksheets.get(sheet_name)
+            if worksheet is not None:
+                return worksheet
+
+            spreadsheet = self.spreadsheet()
+            import gspread
+
+            try:
+                worksheet = spreadsheet.worksheet(sheet_name)
+            except gspread.WorksheetNotFound:
+                if create_headers is None:
+                    raise
+                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows="100", cols="20")
+                worksheet.append_row(create_headers)
+                logger.info(f"Sheet '{sheet_name}' not found. A new one was created with headers.")
+
+            self._worksheets[sheet_name] = worksheet
+            return worksheet
+
+    def reset(self):
+        """
+        Drops the session and every cached handle so the next call reconnects.
+        """
+        with self._lock:
+            self._client = None
+            self._spreadsheet = None
+            self._worksheets = {}
+
+    def run(self, sheet_name: str, operation, create_headers: list = None, write: bool = False, read_key=None):
+        """
+        Runs operation(worksheet) within the Sheets quota, re-authorizing once
+        if the session was rejected and backing off when Google answers 429.
+        Reads passing the same read_key share one request while it is in
+        flight and for SHEETS_READ_FRESH_SECONDS after, so callers must not
+        mutate what they get back. A write drops the shared reads of its sheet.
+        """
+        if write:
+            try:
+                return self._run(sheet_name, operation, create_headers, write)
+            finally:
+                self._reads.forget(lambda key: key[0] == sheet_name)
+        if read_key is not None:
+            return self._reads.do(
+                (sheet_name, read_key), lambda: self._run(sheet_name, operation, create_headers, write)
+            )
+        return self._run(sheet_name, operation, create_headers, write)
+
+    def _run(self, sheet_name: str, operation, create_headers: list, write: bool):
+        reauthorized = False
+        attempt = 0
+        while True:
+            self.limiter.acquire(write)
+            worksheet = self.worksheet(sheet_name, create_headers)
+            try:
+                return operation(worksheet)
+            except Exception as e:
+                if not reauthorized and _is_auth_error(e):
+                    logger.warning(f"-> Google Sheets session rejected ({type(e).__name__}). Reconnecting...")
+                    reauthorized = True
+                    self.reset()
+                    continue
+                if attempt < SHEETS_MAX_RETRIES and _is_rate_limited(e):
+                    delay = self.limiter.back_off(write, attempt)
+                    attempt += 1
+                    logger.warning(f"-> Google Sheets quota exceeded on '{sheet_name}'. Retrying in {delay:.1f}s ({attempt}/{SHEETS_MAX_RETRIES})...")
+                    continue
+                raise
+
+_sheets = SheetsClientManager(GOOGLE_SHEET_ID, SERVICE_ACCOUNT_FILE)
 
 def get_gsheets_client():
     """
-    Configures and returns an authenticated client for Google Sheets.
+    Returns the shared authenticated client for Google Sheets.
     """
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive.file"
-    ]
-    creds = Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=scopes
-    )
-    return gspread.authorize(creds)
+    return _sheets.client()
 
+@traced("sheets")
 def append_row(data: list, sheet_name: str = "Gastos"):
     """
     Appends a new row with the provided data to the specified sheet.
     """
     try:
-        client = get_gsheets_client()
-        spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
-        
-        try:
-            worksheet = spreadsheet.worksheet(sheet_name)
-        except gspread.WorksheetNotFound:
-            worksheet = spreadsheet.add_worksheet(title=sheet_name, rows="100", cols="20")
-            headers = ["Fecha", "Monto", "Categoria", "Descripcion", "Quien", "Tipo"]
-            worksheet.append_row(headers)
-            logger.info(f"Sheet '{sheet_name}' not found. A new one was created with headers.")
-
-        worksheet.append_row(data)
+        _sheets.run(sheet_name, lambda worksheet: worksheet.append_row(data), create_headers=DEFAULT_HEADERS, write=True)
         return True
     except Exception as e:
         logger.error("Error appending row to Google Sheets.")
@@ -51,83 +184,166 @@ def append_row(data: list, sheet_name: str = "Gastos"):
         logger.error(f"Error Details: {repr(e)}")
         return False
 
-def get_all_records(sheet_name: str = "Gastos") -> list[dict]:
+def _first_appended_row(response) -> int:
     """
-    Gets all records from a sheet and returns them as a list of dictionaries.
+    Returns the sheet row where an append landed, read from the API response's
+    updates.updatedRange (e.g. "Gastos!A12:F14"), or None if it is missing.
     """
     try:
-        client = get_gsheets_client()
-        spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
-        worksheet = spreadsheet.worksheet(sheet_name)
-        
-        all_values = worksheet.get_all_values()
-        if not all_values:
-            return []
+        cell_range = response["updates"]["updatedRange"].split("!")[-1]
+        return int(re.match(r"[A-Z]+(\d+)", cell_range).group(1))
+    except (TypeError, KeyError, AttributeError, ValueError):
+        return None
 
-        headers = [header.strip() for header in all_values[0]]
-        
-        records = []
-        for row in all_values[1:]:
-            record_dict = dict(zip(headers, row))
-            records.append(record_dict)
-            
-        return records
+@traced("sheets")
+def append_rows(rows: list[list], sheet_name: str = "Gastos") -> tuple[list[bool], list]:
+    """
+    Appends several rows to the specified sheet in a single request.
+    If the batch write fails, each row is retried on its own so the caller
+    learns exactly which ones were saved; if it failed because the quota is
+    exhausted, nothing is saved and the caller retries later. Returns one
+    success flag per row, plus the sheet row number each one landed on
+    (None if not saved or unknown).
+    """
+    if not rows:
+        return [], []
+    try:
+        response = _sheets.run(sheet_name, lambda worksheet: worksheet.append_rows(rows), create_headers=DEFAULT_HEADERS, write=True)
+        first_row = _first_appended_row(response)
+        positions = [None if first_row is None else first_row + offset for offset in range(len(rows))]
+        return [True] * len(rows), positions
+    except Exception as e:
+        if _is_rate_limited(e):
+            # Splitting the batch would only multiply the requests against an exhausted quota.
+            logger.error(f"Google Sheets quota still exceeded after retries; {len(rows)} rows not appended.")
+            return [False] * len(rows), [None] * len(rows)
+        logger.error(f"Error appending {len(rows)} rows to Google Sheets: {repr(e)}. Retrying one by one.")
+
+    saved, positions = [], []
+    for row in rows:
+        try:
+            response = _sheets.run(sheet_name, lambda worksheet: worksheet.append_row(row), create_headers=DEFAULT_HEADERS, write=True)
+            saved.append(True)
+            positions.append(_first_appended_row(response))
+        except Exception as e:
+            logger.error(f"Error appending row to Google Sheets: {repr(e)}")
+            saved.append(False)
+            positions.append(None)
+            if _is_rate_limited(e):
+                break
+    missing = len(rows) - len(saved)
+    return saved + [False] * missing, positions + [None] * missing
+
+@traced("sheets")
+def get_sheet_values(sheet_name: str = "Gastos"):
+    """
+    Gets every cell value of a sheet, header row included.
+    Returns None if the read failed, so callers can tell it apart from an empty sheet.
+    """
+    try:
+        return _sheets.run(sheet_name, lambda worksheet: worksheet.get_all_values(), read_key="all_values")
     except Exception as e:
         logger.error(f"Error reading from Google Sheets: {e}")
-        return []
+        return None
+
+def _column_letter(column: int) -> str:
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
 
+@traced("sheets")
+def get_rows_from(start_row: int, sheet_name: str = "Gastos", num_cols: int = len(DEFAULT_HEADERS)):
+    """
+    Gets the rows from start_row (1-based) to the end of the sheet, so only a new tail is downloaded.
+    Returns None if the read failed.
+    """
+    last_column = _column_letter(num_cols)
+    range_name = f"A{start_row}:{last_column}"
+    try:
+        return _sheets.run(sheet_name, lambda worksheet: worksheet.get(range_name), read_key=range_name)
+    except Exception as e:
+        logger.error(f"Error reading rows {range_name} from Google Sheets: {e}")
+        return None
+
+@traced("sheets")
 def set_budget(category: str, amount: float) -> bool:
     """
     Sets or updates the budget for a specific category.
     """
     try:
-        client = get_gsheets_client()
-        spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
-        worksheet = spreadsheet.worksheet("Presupuestos")
-        
-        # Find if the category already has a budget
-        cell = worksheet.find(category, in_column=1)
-        
+        # Find if the category already has a budget (a read, charged to the read quota)
+        cell = _sheets.run("Presupuestos", lambda worksheet: worksheet.find(category, in_column=1))
+
         if cell:
             # Update existing budget
-            worksheet.update_cell(cell.row, 2, amount)
+            _sheets.run("Presupuestos", lambda worksheet: worksheet.update_cell(cell.row, 2, amount), write=True)
             logger.info(f"Updated budget for '{category}' to {amount}.")
         else:
             # Add new budget
-            worksheet.append_row([category, amount])
+            _sheets.run("Presupuestos", lambda worksheet: worksheet.append_row([category, amount]), write=True)
             logger.info(f"Set new budget for '{category}' to {amount}.")
+        _budgets_cache.update(lambda budgets: budgets.__setitem__(category.lower(), float(amount)))
         return True
     except Exception as e:
         logger.error(f"Error setting budget for '{category}': {e}")
         return False
 
-def get_budgets() -> dict:
-    """
-    Gets all budgets and returns them as a dictionary for easy lookup.
-    """
+@traced("sheets", "load_budgets")
+def _load_budgets():
     try:
-        client = get_gsheets_client()
-        spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
-        worksheet = spreadsheet.worksheet("Presupuestos")
-        records = worksheet.get_all_records()
+        records = _sheets.run("Presupuestos", lambda worksheet: worksheet.get_all_records(), read_key="records")
         # Convert list of dicts to a single dict: {'Category': Amount, ...}
         return {record['Categoria'].lower(): float(record['MontoMaximo']) for record in records}
     except Exception as e:
         logger.error(f"Error fetching budgets: {e}")
-        return {}
+        return None
+
+_budgets_cache = TTLCache("budgets", _load_budgets, BUDGETS_REFRESH_SECONDS)
+
+def get_budgets() -> dict:
+    """
+    Gets all budgets and returns them as a dictionary for easy lookup.
+    The sheet is read at most once every BUDGETS_REFRESH_SECONDS; set_budget
+    keeps the cached copy up to date in between.
+    """
+    budgets = _budgets_cache.get()
+    return dict(budgets) if budgets is not None else {}
+
+def _load_categories():
+    all_values = get_sheet_values("Categorias")
+    if all_values is None:
+        return None
+    headers = [header.strip() for header in all_values[0]] if all_values else []
+    records = [dict(zip(headers, row)) for row in all_values[1:]]
+    # Keep a simple list of lowercase category names
+    return [record['Nombre'].lower() for record in records if record.get('Nombre')]
+
+_categories_cache = TTLCache("categories", _load_categories, CATEGORIES_REFRESH_SECONDS)
     
 def get_categories() -> list[str]:
     """
     Gets all valid categories from the 'Categorias' sheet.
+    The sheet is read at most once every CATEGORIES_REFRESH_SECONDS.
     """
-    try:
-        records = get_all_records(sheet_name="Categorias")
-        # Return a simple list of lowercase category names
-        return [record['Nombre'].lower() for record in records if record.get('Nombre')]
-    except Exception as e:
-        logger.error(f"Error fetching categories: {e}", exc_info=True)
+    categories = _categories_cache.get()
+    if categories is None:
         # Fallback to a default list if the sheet can't be read
         return ["otros"]
+    return list(categories)
+
+def cache_stats() -> dict:
+    """
+    Returns hit/miss counters for the sheet caches and how many reads were shared.
+    """
+    return {"categories": _categories_cache.stats(), "budgets": _budgets_cache.stats(), "reads": _sheets._reads.stats()}
+
+def rate_limit_stats() -> dict:
+    """
+    Returns the quota limiter's counters.
+    """
+    return _sheets.limiter.stats()
 
 def add_category(category_name: str) -> bool:
     """
@@ -137,7 +353,7 @@ def add_category(category_name: str) -> bool:
         # Capitalize for consistency in the sheet
         category_name_capitalized = category_name.capitalize()
         
-        # First, check if it already exists to avoid duplicates
+        # First, check the cached list to avoid duplicates
         existing_categories = get_categories()
         if category_name.lower() in existing_categories:
             logger.warning(f"Category '{category_name}' already exists.")
@@ -146,6 +362,7 @@ def add_category(category_name: str) -> bool:
         # If it doesn't exist, add it
         success = append_row([category_name_capitalized], sheet_name="Categorias")
         if success:
+            _categories_cache.update(lambda categories: categories.append(category_name.lower()))
             logger.info(f"Successfully added new category: '{category_name_capitalized}'")
         return success
     except Exception as e:
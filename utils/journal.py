@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "data/journal.sqlite3")
+
+class AppendJournal:
+    """
+    Durable local queue of rows waiting to be appended to a sheet.
+    Rows are committed to SQLite first; a background thread writes them to
+    the sheet in batches, backing off while the sheet is failing, and deletes
+    them once they are saved. Rows left over from a previous run are flushed
+    when the thread starts again.
+    """
+    def __init__(self, path: str, sheet_name: str, batch_size: int = 100, max_backoff: float = 300):
+        self.path = path
+        self.sheet_name = sheet_name
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        # Only one flush at a time, or a batch could be written twice before it is deleted.
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending_rows ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, sheet_name TEXT NOT NULL, "
+                "row_json TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def enqueue(self, rows: list[list]) -> bool:
+        """
+        Durably stores rows for a later flush. Returns False if the local write failed.
+        """
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO pending_rows (sheet_name, row_json, created_at) VALUES (?, ?, ?)",
+                        [(self.sheet_name, json.dumps(row), time.time()) for row in rows],
+                    )
+        except (sqlite3.Error, OSError, TypeError, ValueError) as e:
+            logger.error(f"Error writing {len(rows)} rows to the local journal: {e}")
+            return False
+        self._wake.set()
+        return True
+
+    def _pending(self, limit: int = -1) -> list[tuple[int, list]]:
+        with self._lock:
+            cursor = self._connection().execute(
+                "SELECT id, row_json FROM pending_rows WHERE sheet_name = ? ORDER BY id LIMIT ?",
+                (self.sheet_name, limit),
+            )
+            return [(row_id, json.loads(row_json)) for row_id, row_json in cursor.fetchall()]
+
+    def pending_rows(self) -> list[list]:
+        """
+        Returns the rows not yet written to the sheet, oldest first.
+        """
+        try:
+            return [row for _, row in self._pending()]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading the local journal: {e}")
+            return []
+
+    def _delete(self, row_ids: list[int]):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("DELETE FROM pending_rows WHERE id = ?", [(row_id,) for row_id in row_ids])
+
+    def flush_once(self, write_rows) -> bool:
+        """
+        Writes the oldest batch with write_rows(rows, on_written) -> list[bool].
+        write_rows must call on_written(results) as soon as the rows are saved,
+        so they stop being pending at the same moment they appear in the sheet.
+        Returns True if the batch was fully written or there was nothing to write.
+        """
+        with self._flush_lock:
+            batch = self._pending(self.batch_size)
+            if not batch:
+                return True
+            written_ids = []
+
+            def forget_written(results: list[bool]):
+                written_ids.extend(row_id for (row_id, _), ok in zip(batch, results) if ok)
+                if written_ids:
+                    self._delete(written_ids)
+
+            write_rows([row for _, row in batch], forget_written)
+            if written_ids:
+                logger.info(f"-> Journal flushed {len(written_ids)} rows to '{self.sheet_name}'.")
+            return len(written_ids) == len(batch)
+
+    def start(self, write_rows):
+        """
+        Starts the background flusher. Any rows left by a previous run go out first.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(write_rows,), name="journal-flusher", daemon=True)
+        self._thread.start()
+        self._wake.set()
+
+    def _run(self, write_rows):
+        backoff = 1.0
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while not self._stop.is_set():
+                try:
+                    complete = self.flush_once(write_rows)
+                except Exception as e:
+                    logger.error(f"Error flushing the local journal: {e}", exc_info=True)
+                    complete = False
+                if complete:
+                    backoff = 1.0
+                    if not self._pending(1):
+                        break
+                    continue
+                logger.warning(f"-> Journal flush incomplete. Retrying in {backoff:.0f} seconds...")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def stop(self, write_rows=None):
+        """
+        Stops the flusher and, if write_rows is given, makes one last flush attempt.
+        A flush still in progress is waited for, so no batch is written twice.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            if self._thread.is_alive():
+                logger.warning("-> Journal flusher still writing; waiting for it before the final flush.")
+            self._thread = None
+        if write_rows is not None:
+            try:
+                while self._pending(1) and self.flush_once(write_rows):
+                    pass
+            except Exception as e:
+                logger.error(f"Error flushing the local journal on shutdown: {e}")
@@ -0,0 +1,433 @@
+import os
+import sys
+import time
+import logging
+import threading
+from array import array
+from collections import defaultdict
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import NamedTuple
+from utils.gsheets_api import append_rows, get_sheet_values, get_rows_from, DEFAULT_HEADERS
+from utils.journal import AppendJournal, JOURNAL_PATH
+
+logger = logging.getLogger(__name__)
+
+LEDGER_REFRESH_SECONDS = float(os.getenv("LEDGER_REFRESH_SECONDS", "60"))
+
+class Transaction(NamedTuple):
+    """
+    A ledger row parsed once: the date as an ordinal, the amount as a float,
+    and the category and type as interned lowercase strings.
+    """
+    ordinal: int
+    amount: float
+    category: str
+    type: str
+    description: str
+    who: str
+
+    @property
+    def date(self) -> str:
+        return date.fromordinal(self.ordinal).isoformat()
+
+def parse_row(headers: list, row: list):
+    """
+    Converts a raw sheet row into a Transaction, or None if its date or amount is invalid.
+    """
+    record = dict(zip(headers, row))
+    try:
+        ordinal = date.fromisoformat(record.get("Fecha", "").strip()).toordinal()
+        amount = float(record.get("Monto") or 0)
+    except (ValueError, TypeError):
+        return None
+    return Transaction(
+        ordinal=ordinal,
+        amount=amount,
+        category=sys.intern(record.get("Categoria", "").strip().lower()),
+        type=sys.intern(record.get("Tipo", "").strip()),
+        description=record.get("Descripcion", ""),
+        who=sys.intern(record.get("Quien", "")),
+    )
+
+class PeriodSummary(NamedTuple):
+    """
+    Totals of a date range: expenses per category and income per description.
+    """
+    count: int
+    spent: float
+    earned: float
+    by_category: dict
+    by_source: dict
+
+_numpy_module = None
+
+def _numpy():
+    """
+    Returns numpy if it is installed, else None. Imported on first use so it
+    does not slow down startup.
+    """
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            import numpy
+            _numpy_module = numpy
+        except ImportError:
+            logger.info("-> numpy not installed; ledger summaries use plain Python.")
+            _numpy_module = False
+    return _numpy_module or None
+
+class Codes:
+    """
+    Dictionary encoding of a string column: each distinct value gets a small int.
+    """
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def get(self, value: str):
+        return self._codes.get(value)
+
+def _totals_by_code(amounts: array, selected_codes: array, wanted: int, group_codes: array, size: int) -> dict:
+    """
+    Sums amounts (and counts rows) per group code over the rows whose
+    selected_codes equal wanted. Returns {group code: total} for the groups
+    that have rows.
+    """
+    np = _numpy()
+    if np is not None:
+        mask = np.frombuffer(selected_codes, dtype=np.intc) == wanted
+        groups = np.frombuffer(group_codes, dtype=np.intc)[mask]
+        weights = np.frombuffer(amounts, dtype=np.float64)[mask]
+        totals = np.bincount(groups, weights=weights, minlength=size)
+        counts = np.bincount(groups, minlength=size)
+        return {int(code): float(totals[code]) for code in np.flatnonzero(counts)}
+
+    totals = [0.0] * size
+    counts = [0] * size
+    for selected, group, amount in zip(selected_codes, group_codes, amounts):
+        if selected == wanted:
+            totals[group] += amount
+            counts[group] += 1
+    return {code: totals[code] for code in range(size) if counts[code]}
+
+class Ledger:
+    """
+    In-memory, date-sorted copy of the transactions sheet, stored as columns:
+    date ordinals and amounts in typed arrays, and category, type, description
+    and author as small-int codes. The sheet is downloaded once; our own
+    appends are applied locally as soon as they reach the journal, and
+    refreshes only pull the rows added after the last known one.
+    Date ranges are found with bisect and summarized with masks and bincount
+    (numpy when installed); monthly spend per category is kept as a running total.
+    """
+    def __init__(self, sheet_name: str = "Gastos", refresh_interval: float = LEDGER_REFRESH_SECONDS, journal: AppendJournal = None):
+        self.sheet_name = sheet_name
+        self.refresh_interval = refresh_interval
+        self.journal = journal
+        self._lock = threading.RLock()
+        self._headers = None
+        self._clear()
+        self._synced_rows = 0
+        # Sheet rows past _synced_rows that we wrote ourselves and already hold locally.
+        self._own_rows = set()
+        self._writing = False
+        # Set while a load waits for our write in flight; the next write waits for the load.
+        self._load_waiting = False
+        self._write_done = threading.Condition(self._lock)
+        self._last_sync = 0.0
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def _clear(self):
+        self._ordinals = array("i")
+        self._amounts = array("d")
+        self._categories = array("i")
+        self._types = array("i")
+        self._descriptions = array("i")
+        self._whos = array("i")
+        self._category_codes = Codes()
+        self._type_codes = Codes()
+        self._description_codes = Codes()
+        self._who_codes = Codes()
+        self._monthly_spend = defaultdict(float)
+
+    def _aggregate(self, transaction: Transaction):
+        if transaction.type == "Gasto":
+            day = date.fromordinal(transaction.ordinal)
+            self._monthly_spend[(day.year, day.month, transaction.category)] += transaction.amount
+
+    def _parse_rows(self, rows: list, headers: list) -> list[Transaction]:
+        transactions = []
+        for row in rows:
+            transaction = parse_row(headers, row)
+            if transaction is None:
+                if any(row):
+                    logger.debug(f"-> Skipping ledger row with invalid date or amount: {row}")
+                continue
+            transactions.append(transaction)
+        return transactions
+
+    def _add_rows(self, rows: list, headers: list) -> int:
+        transactions = self._parse_rows(rows, headers)
+        for transaction in transactions:
+            self._insert(transaction)
+        return len(transactions)
+
+    def _encode(self, transaction: Transaction) -> tuple:
+        return (
+            self._category_codes.code(transaction.category),
+            self._type_codes.code(transaction.type),
+            self._description_codes.code(transaction.description),
+            self._who_codes.code(transaction.who),
+        )
+
+    def _insert(self, transaction: Transaction):
+        # bisect_right keeps rows of the same day in sheet order.
+        index = bisect_right(self._ordinals, transaction.ordinal)
+        category, type_, description, who = self._encode(transaction)
+        self._ordinals.insert(index, transaction.ordinal)
+        self._amounts.insert(index, transaction.amount)
+        self._categories.insert(index, category)
+        self._types.insert(index, type_)
+        self._descriptions.insert(index, description)
+        self._whos.insert(index, who)
+        self._aggregate(transaction)
+
+    def _extend(self, transactions: list[Transaction]):
+        # Only for transactions already in date order after the current ones.
+        for transaction in transactions:
+            category, type_, description, who = self._encode(transaction)
+            self._ordinals.append(transaction.ordinal)
+            self._amounts.append(transaction.amount)
+            self._categories.append(category)
+            self._types.append(type_)
+            self._descriptions.append(description)
+            self._whos.append(who)
+            self._aggregate(transaction)
+
+    def _transaction(self, index: int) -> Transaction:
+        return Transaction(
+            ordinal=self._ordinals[index],
+            amount=self._amounts[index],
+            category=self._category_codes.values[self._categories[index]],
+            type=self._type_codes.values[self._types[index]],
+            description=self._description_codes.values[self._descriptions[index]],
+            who=self._who_codes.values[self._whos[index]],
+        )
+
+    def _load(self):
+        all_values = get_sheet_values(self.sheet_name)
+        if all_values is None:
+            return
+        self._clear()
+        self._own_rows = set()
+        if not all_values:
+            # Empty sheet: stay unloaded so the next read picks up the header row.
+            self._headers, self._synced_rows = None, 0
+        else:
+            self._headers = [header.strip() for header in all_values[0]]
+            self._extend(sorted(self._parse_rows(all_values[1:], self._headers), key=lambda t: t.ordinal))
+            self._synced_rows = len(all_values) - 1
+            if self.journal:
+                # Rows still waiting in the journal are not in the sheet yet.
+                self._add_rows(self.journal.pending_rows(), DEFAULT_HEADERS)
+        self._last_sync = time.monotonic()
+        logger.info(f"-> Ledger loaded {len(self)} transactions from '{self.sheet_name}'.")
+
+    def refresh(self):
+        """
+        Pulls the rows appended to the sheet since the last sync. The first
+        time it loads the whole sheet, after any write in flight has landed.
+        """
+        with self._lock:
+            if self._headers is None:
+                # Nothing to serve yet: wait for a write in flight to land, then load.
+                self._load_waiting = True
+                try:
+                    while self._writing:
+                        self._write_done.wait()
+                    self._load()
+                finally:
+                    self._load_waiting = False
+                    self._write_done.notify_all()
+                return
+            if self._writing:
+                # Our own rows are landing in the sheet; reading now would count them twice.
+                return
+            self._pull_tail()
+
+    def _pull_tail(self):
+        # +1 for the header row, +1 because rows are 1-based.
+        start_row = self._synced_rows + 2
+        new_rows = get_rows_from(start_row, self.sheet_name, len(self._headers))
+        if new_rows is None:
+            return
+        end_row = start_row + len(new_rows)
+        # Our own rows are already in the local copy.
+        other_rows = [row for position, row in enumerate(new_rows, start_row) if position not in self._own_rows]
+        added = self._add_rows(other_rows, self._headers)
+        self._own_rows = {position for position in self._own_rows if position >= end_row}
+        self._synced_rows += len(new_rows)
+        self._last_sync = time.monotonic()
+        if other_rows:
+            logger.info(f"-> Ledger pulled {added} new transactions from '{self.sheet_name}'.")
+
+    def _ensure_fresh(self):
+        if self._headers is None or time.monotonic() - self._last_sync > self.refresh_interval:
+            self.refresh()
+
+    def _range(self, start_date: date, end_date: date) -> tuple[int, int]:
+        self._ensure_fresh()
+        return (
+            bisect_left(self._ordinals, start_date.toordinal()),
+            bisect_right(self._ordinals, end_date.toordinal()),
+        )
+
+    def expenses_in(self, categories: list[str], start_date: date, end_date: date) -> list[Transaction]:
+        """
+        Returns the expenses of the given categories dated from start_date to
+        end_date, inclusive, in date order.
+        """
+        with self._lock:
+            lo, hi = self._range(start_date, end_date)
+            expense = self._type_codes.get("Gasto")
+            wanted = {self._category_codes.get(category) for category in categories} - {None}
+            if expense is None or not wanted or lo == hi:
+                return []
+
+            np = _numpy()
+            if np is not None:
+                mask = np.frombuffer(self._types[lo:hi], dtype=np.intc) == expense
+                mask &= np.isin(np.frombuffer(self._categories[lo:hi], dtype=np.intc), list(wanted))
+                indexes = (lo + np.flatnonzero(mask)).tolist()
+            else:
+                indexes = [
+                    index for index in range(lo, hi)
+                    if self._types[index] == expense and self._categories[index] in wanted
+                ]
+            return [self._transaction(index) for index in indexes]
+
+    def summarize(self, start_date: date, end_date: date) -> PeriodSummary:
+        """
+        Totals the transactions dated from start_date to end_date, inclusive:
+        expenses per category and income per description, in one pass over the columns.
+        """
+        with self._lock:
+            lo, hi = self._range(start_date, end_date)
+            types, amounts = self._types[lo:hi], self._amounts[lo:hi]
+            by_category, by_source = {}, {}
+
+            expense = self._type_codes.get("Gasto")
+            if expense is not None and lo < hi:
+                totals = _totals_by_code(amounts, types, expense, self._categories[lo:hi], len(self._category_codes))
+                by_category = {self._category_codes.values[code]: total for code, total in totals.items()}
+            income = self._type_codes.get("Ingreso")
+            if income is not None and lo < hi:
+                totals = _totals_by_code(amounts, types, income, self._descriptions[lo:hi], len(self._description_codes))
+                by_source = {self._description_codes.values[code]: total for code, total in totals.items()}
+
+            return PeriodSummary(
+                count=hi - lo,
+                spent=sum(by_category.values()),
+                earned=sum(by_source.values()),
+                by_category=by_category,
+                by_source=by_source,
+            )
+
+    def monthly_spend(self, category: str, year: int, month: int) -> float:
+        """
+        Returns the total spent on a category in the given month.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            return self._monthly_spend.get((year, month, category.strip().lower()), 0.0)
+
+    def write_rows(self, rows: list[list], on_written=None) -> list[bool]:
+        """
+        Writes rows straight to the sheet. If they landed right after the last
+        synced row the sync point just moves past them; if someone else added
+        rows in between, the tail is pulled in, skipping ours.
+        on_written(results) runs before the ledger lock is released, so the
+        journal can drop the saved rows before any load sees them both in the
+        sheet and as pending.
+        """
+        with self._lock:
+            while self._load_waiting:
+                self._write_done.wait()
+            self._writing = True
+        results, positions = [], []
+        try:
+            results, positions = append_rows(rows, self.sheet_name)
+        finally:
+            with self._lock:
+                try:
+                    if on_written is not None:
+                        on_written(results)
+                finally:
+                    self._writing = False
+                    self._write_done.notify_all()
+                    self._track_own_rows(results, positions)
+        return results
+
+    def _track_own_rows(self, results: list[bool], positions: list):
+        if self._headers is None or not any(results):
+            return
+        if any(ok and position is None for ok, position in zip(results, positions)):
+            logger.warning(f"-> Could not tell where rows landed in '{self.sheet_name}'. Reloading the ledger.")
+            self._headers = None
+            return
+        self._own_rows.update(position for ok, position in zip(results, positions) if ok)
+        while self._synced_rows + 2 in self._own_rows:
+            self._own_rows.remove(self._synced_rows + 2)
+            self._synced_rows += 1
+        if self._own_rows:
+            self._pull_tail()
+
+    def append_many(self, rows: list[list]) -> list[bool]:
+        """
+        Records rows and adds them to the local copy. With a journal the rows are
+        only committed locally and flushed to the sheet in the background;
+        otherwise they are written to the sheet in one request.
+        Returns one success flag per row.
+        """
+        # Rows we write always follow the DEFAULT_HEADERS column order.
+        local_rows = [["" if value is None else str(value) for value in row] for row in rows]
+        if self.journal:
+            # Under the lock, so a load in progress cannot pick the rows up from
+            # the journal and have them added a second time here.
+            with self._lock:
+                if self.journal.enqueue(rows):
+                    if self._headers is not None:
+                        self._add_rows(local_rows, DEFAULT_HEADERS)
+                    return [True] * len(rows)
+
+        results = self.write_rows(rows)
+        with self._lock:
+            if self._headers is not None:
+                self._add_rows([row for row, ok in zip(local_rows, results) if ok], DEFAULT_HEADERS)
+        return results
+
+    def start_write_behind(self):
+        """
+        Starts flushing journaled rows to the sheet in the background.
+        """
+        if self.journal:
+            self.journal.start(self.write_rows)
+
+    def stop_write_behind(self):
+        if self.journal:
+            self.journal.stop(self.write_rows)
+
+ledger = Ledger("Gastos", journal=AppendJournal(JOURNAL_PATH, "Gastos"))
@@ -0,0 +1,103 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from utils.text import normalize
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+
+def make_key(prompt: str, message_text: str) -> str:
+    """
+    Builds a cache key from the normalized message text, the prompt template
+    (the prompt without the message) and today's date.
+    """
+    template = prompt.replace(message_text, "")
+    template_hash = hashlib.sha256(template.encode("utf-8")).hexdigest()
+    raw_key = "\0".join([normalize(message_text), template_hash, date.today().isoformat()])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    LRU cache of LLM responses with a TTL, backed by a small SQLite file so
+    answers survive restarts. Memory holds the most recent entries; the file
+    is consulted on a memory miss.
+    """
+    def __init__(self, path: str, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: float = LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        return self._conn
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """
+        Returns the cached response for key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                try:
+                    row = self._connection().execute(
+                        "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error(f"Error reading the LLM cache: {e}")
+                    row = None
+                if row:
+                    entry = (row[0], row[1])
+                    self._remember(key, *entry)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            created_at = time.time()
+            self._remember(key, response, created_at)
+            try:
+                with self._connection() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                        (key, response, created_at),
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Error writing the LLM cache: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+response_cache = LLMResponseCache(LLM_CACHE_PATH)
@@ -0,0 +1,147 @@
+import os
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+import contextlib
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Google Sheets allows about 60 read and 60 write requests per minute per user.
+SHEETS_READS_PER_MINUTE = float(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+SHEETS_WRITES_PER_MINUTE = float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+SHEETS_BURST = float(os.getenv("SHEETS_BURST", "10"))
+SHEETS_MAX_BACKOFF_SECONDS = float(os.getenv("SHEETS_MAX_BACKOFF_SECONDS", "64"))
+
+# Lower runs first.
+WRITE = 0
+FOREGROUND = 1
+BACKGROUND = 2
+
+_read_priority = ContextVar("sheets_read_priority", default=FOREGROUND)
+
+@contextlib.contextmanager
+def background():
+    """
+    Marks the Sheets reads made inside the block as background refreshes,
+    so they yield to writes and to reads a user is waiting for.
+    """
+    token = _read_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _read_priority.reset(token)
+
+def in_background(function, *args, **kwargs):
+    with background():
+        return function(*args, **kwargs)
+
+class TokenBucket:
+    """
+    Blocking token bucket refilled at per_minute / 60 tokens per second, up to
+    burst. Waiters are served by priority, then arrival order. A 429 pauses
+    the refill for everyone via pause().
+    """
+    def __init__(self, name: str, per_minute: float, burst: float):
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float):
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self._updated = max(self._updated, now)
+
+    def acquire(self, priority: int = FOREGROUND):
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            # A more urgent ticket may have just become the head.
+            self._cond.notify_all()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    is_next = self._waiting[0] == ticket
+                    if is_next and self.tokens >= 1 and now >= self._paused_until:
+                        heapq.heappop(self._waiting)
+                        self.tokens -= 1
+                        self._cond.notify_all()
+                        break
+                    timeout = None
+                    if is_next:
+                        timeout = max(self._paused_until - now, (1 - self.tokens) / self.rate, 0.001)
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            self.acquired += 1
+            waited = time.monotonic() - started
+            if waited > 0.01:
+                self.waited += 1
+                self.wait_seconds += waited
+
+    def pause(self, seconds: float):
+        """
+        Empties the bucket and stops the refill for seconds.
+        """
+        with self._cond:
+            self._refill(time.monotonic())
+            self.tokens = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "queued": len(self._waiting),
+            }
+
+class SheetsRateLimiter:
+    """
+    Keeps the process within the Sheets read and write quotas. Writes go
+    first, then reads someone is waiting for, then background refreshes.
+    """
+    def __init__(self, reads_per_minute: float = SHEETS_READS_PER_MINUTE,
+                 writes_per_minute: float = SHEETS_WRITES_PER_MINUTE, burst: float = SHEETS_BURST):
+        self.reads = TokenBucket("reads", reads_per_minute, burst)
+        self.writes = TokenBucket("writes", writes_per_minute, burst)
+        self.rate_limited = 0
+
+    def _bucket(self, write: bool) -> TokenBucket:
+        return self.writes if write else self.reads
+
+    def acquire(self, write: bool):
+        self._bucket(write).acquire(WRITE if write else _read_priority.get())
+
+    def back_off(self, write: bool, attempt: int) -> float:
+        """
+        Called after a 429: pauses the matching bucket for an exponential,
+        jittered delay so every caller slows down, not just this one.
+        """
+        self.rate_limited += 1
+        delay = random.uniform(0.5, 1.0) * min(SHEETS_MAX_BACKOFF_SECONDS, 2 ** (attempt + 1))
+        self._bucket(write).pause(delay)
+        return delay
+
+    def stats(self) -> dict:
+        return {"reads": self.reads.stats(), "writes": self.writes.stats(), "rate_limited": self.rate_limited}
@@ -0,0 +1,114 @@
+import json
+
+# Schemas use the OpenAPI subset accepted by Gemini's response_schema, so the
+# same definition constrains the model and validates what it returns.
+
+EXPENSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "amount": {"type": "NUMBER"},
+        "category": {"type": "STRING"},
+        "description": {"type": "STRING"},
+    },
+    "required": ["amount", "category", "description"],
+}
+
+EXPENSE_LIST_SCHEMA = {"type": "ARRAY", "items": EXPENSE_SCHEMA}
+
+INCOME_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "amount": {"type": "NUMBER"},
+        "description": {"type": "STRING"},
+    },
+    "required": ["amount", "description"],
+}
+
+BUDGET_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "category": {"type": "STRING"},
+        "amount": {"type": "NUMBER"},
+    },
+    "required": ["category", "amount"],
+}
+
+CATEGORY_NAMES_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "category_names": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["category_names"],
+}
+
+INTENTS = [
+    "REGISTRAR_GASTO", "REGISTRAR_INGRESO", "CONSULTAR_GASTOS", "DEFINIR_PRESUPUESTO",
+    "CONSULTAR_PRESUPUESTO", "AGREGAR_CATEGORIA", "CONSULTAR_GASTOS_POR_CATEGORIA",
+    "PEDIR_AYUDA", "OTRO",
+]
+
+INTENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "intent": {"type": "STRING", "enum": INTENTS},
+        "entities": {
+            "type": "OBJECT",
+            "properties": {
+                "expenses": EXPENSE_LIST_SCHEMA,
+                "amount": {"type": "NUMBER"},
+                "description": {"type": "STRING"},
+                "category": {"type": "STRING"},
+                "categories": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "category_names": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "period": {"type": "STRING"},
+            },
+        },
+    },
+    "required": ["intent", "entities"],
+}
+
+TYPE_CHECKS = {
+    "OBJECT": lambda value: isinstance(value, dict),
+    "ARRAY": lambda value: isinstance(value, list),
+    "STRING": lambda value: isinstance(value, str),
+    "NUMBER": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "INTEGER": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "BOOLEAN": lambda value: isinstance(value, bool),
+}
+
+def validate(data, schema: dict, path: str = "$") -> list[str]:
+    """
+    Checks data against a schema and returns a list of errors (empty if valid).
+    """
+    if data is None:
+        return [] if schema.get("nullable") else [f"{path}: missing value"]
+
+    expected_type = schema.get("type")
+    if expected_type and not TYPE_CHECKS[expected_type](data):
+        return [f"{path}: expected {expected_type.lower()}, got {type(data).__name__}"]
+
+    errors = []
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: {data!r} is not one of {schema['enum']}")
+    if expected_type == "OBJECT":
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}.{key}: required")
+        for key, property_schema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate(data[key], property_schema, f"{path}.{key}"))
+    elif expected_type == "ARRAY" and "items" in schema:
+        for index, item in enumerate(data):
+            errors.extend(validate(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+def parse_json(text: str, schema: dict):
+    """
+    Parses an LLM response and validates it. Returns (data, errors).
+    """
+    try:
+        data = json.loads((text or "").strip().replace("```json", "").replace("```", ""))
+    except (json.JSONDecodeError, TypeError) as e:
+        return None, [f"invalid JSON: {e}"]
+    errors = validate(data, schema)
+    return (data if not errors else None), errors
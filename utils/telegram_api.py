@@ -1,20 +1,48 @@
 import os
+import json
 import telegram
 import logging
 from telegram import Update
-from dotenv import load_dotenv
+from telegram.request import HTTPXRequest
 import asyncio
-from pydub import AudioSegment
-
-load_dotenv()
+from urllib.parse import urlsplit
+from utils import config
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-if not TELEGRAM_TOKEN:
-    raise ValueError("TELEGRAM_TOKEN not found in .env file.")
+TELEGRAM_TOKEN = config.TELEGRAM_TOKEN
+TELEGRAM_MODE = config.TELEGRAM_MODE
+POLL_TIMEOUT = config.POLL_TIMEOUT
+WEBHOOK_URL = config.WEBHOOK_URL
+WEBHOOK_SECRET = config.WEBHOOK_SECRET
+WEBHOOK_PORT = config.WEBHOOK_PORT
 
 LAST_UPDATE_ID = None
+BOT = None
+
+def get_bot() -> telegram.Bot:
+    """
+    Returns the process-wide Bot, so every call reuses the same HTTP connection pools.
+    Long polls get their own pool so they never hold up outgoing messages.
+    """
+    global BOT
+    if BOT is None:
+        BOT = telegram.Bot(
+            token=TELEGRAM_TOKEN,
+            request=HTTPXRequest(connection_pool_size=8),
+            get_updates_request=HTTPXRequest(connection_pool_size=1, read_timeout=10),
+        )
+    return BOT
+
+async def shutdown_bot():
+    """
+    Closes the Bot's HTTP connection pools.
+    """
+    global BOT
+    if BOT is not None:
+        await BOT.shutdown()
+        BOT = None
 
 async def initialize_bot():
     """
@@ -22,37 +50,70 @@ async def initialize_bot():
     This prevents the bot from processing old messages when it restarts.
     """
     global LAST_UPDATE_ID
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
+    bot = get_bot()
     updates = await bot.get_updates(timeout=1)
     if updates:
         LAST_UPDATE_ID = updates[-1].update_id
         logger.info(f"-> Bot initialized. {len(updates)} pending messages have been cleaned.")
 
-async def get_latest_updates():
+async def start_polling():
+    """
+    Prepares the bot for long polling. getUpdates is rejected while a webhook is set.
+    """
+    bot = get_bot()
+    await bot.initialize()
+    await bot.delete_webhook()
+
+async def get_pending_updates() -> list[dict]:
     """
-    Gets the latest un-processed message, handling text, voice, and button callbacks.
+    Gets every un-processed update from a single getUpdates call, oldest first.
+    The call is a long poll: Telegram answers as soon as an update arrives, or
+    with an empty list after POLL_TIMEOUT seconds.
+    Handles text, voice, and button callbacks.
     """
     global LAST_UPDATE_ID
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
+    bot = get_bot()
     offset = LAST_UPDATE_ID + 1 if LAST_UPDATE_ID else None
-    updates = await bot.get_updates(offset=offset, timeout=5)
+    updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
 
     if not updates:
-        return None
+        return []
+
+    # Acknowledge the whole batch at once; every update in it is handled below.
+    LAST_UPDATE_ID = updates[-1].update_id
+    return await parse_updates(bot, updates)
+
+async def parse_updates(bot: telegram.Bot, updates: list[Update]) -> list[dict]:
+    """
+    Converts a batch of updates into message dicts, skipping the ones that fail.
+    """
+    messages = []
+    for update in updates:
+        try:
+            message = await parse_update(bot, update)
+        except Exception as e:
+            logger.error(f"Error parsing update {update.update_id}: {e}")
+            continue
+        if message:
+            messages.append(message)
 
-    latest_update = updates[-1]
-    LAST_UPDATE_ID = latest_update.update_id
-    
+    logger.info(f"-> Received {len(updates)} updates, {len(messages)} messages to process.")
+    return messages
+
+async def parse_update(bot: telegram.Bot, update: Update):
+    """
+    Converts a single Telegram update into the message dict used by the flow.
+    """
     # Case 1: It's a button press (callback_query)
-    if latest_update.callback_query:
-        callback_data = latest_update.callback_query.data
-        user_name = latest_update.callback_query.from_user.first_name
-        chat_id = latest_update.callback_query.message.chat_id
+    if update.callback_query:
+        callback_data = update.callback_query.data
+        user_name = update.callback_query.from_user.first_name
+        chat_id = update.callback_query.message.chat_id
         
         logger.info(f"-> Button press received from '{user_name}': '{callback_data}'")
         
         # Acknowledge the button press to remove the "loading" icon
-        await latest_update.callback_query.answer()
+        await update.callback_query.answer()
         
         # Treat the button's data as a new text message
         return {
@@ -63,50 +124,147 @@ async def get_latest_updates():
         }
 
     # If it's not a callback, check for a regular message
-    if not latest_update.message:
+    if not update.message:
         return None
 
-    user_name = latest_update.message.from_user.first_name
-    chat_id = latest_update.message.chat_id
+    user_name = update.message.from_user.first_name
+    chat_id = update.message.chat_id
 
     # Case 2: It's a text message
-    if latest_update.message.text:
+    if update.message.text:
         return {
             "type": "text",
             "chat_id": chat_id,
-            "message_text": latest_update.message.text,
+            "message_text": update.message.text,
             "user_name": user_name
         }
 
     # Case 3: It's a voice message
-    if latest_update.message.voice:
+    if update.message.voice:
         logger.info(f"-> Voice message received from '{user_name}'.")
-        voice = latest_update.message.voice
-        file = await bot.get_file(voice.file_id)
-        
-        os.makedirs("temp", exist_ok=True)
-        ogg_path = f"temp/{voice.file_id}.ogg"
-        wav_path = f"temp/{voice.file_id}.wav"
-
-        await file.download_to_drive(ogg_path)
-        
-        audio = AudioSegment.from_ogg(ogg_path)
-        audio.export(wav_path, format="wav")
-        
-        os.remove(ogg_path)
-
+        voice = update.message.voice
+        # The download happens later, in the flow, so the poll loop never waits on it.
         return {
             "type": "audio",
             "chat_id": chat_id,
-            "audio_path": wav_path,
+            "file_id": voice.file_id,
+            "mime_type": voice.mime_type or "audio/ogg",
             "user_name": user_name
         }
 
     return None
 
+@traced("telegram")
+async def download_voice(file_id: str) -> bytes:
+    """
+    Downloads a voice note into memory, without touching the disk.
+    """
+    file = await get_bot().get_file(file_id)
+    return bytes(await file.download_as_bytearray())
+
+@traced("telegram")
 async def send_message(chat_id: int, text: str, reply_markup=None):
     """
     Sends a message to a specific Telegram chat.
     """
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
-    await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, parse_mode='Markdown')
\ No newline at end of file
+    bot = get_bot()
+    await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, parse_mode='Markdown')
+
+HTTP_RESPONSES = {
+    200: b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    400: b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    403: b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+}
+MAX_WEBHOOK_BODY = 1024 * 1024
+# Idle or slow connections are dropped after this many seconds per read.
+WEBHOOK_READ_TIMEOUT_SECONDS = 10
+
+class WebhookReceiver:
+    """
+    Small HTTP server that receives the updates Telegram pushes to our webhook.
+    Updates are queued as soon as they arrive; get_pending_updates() waits for
+    the next one and returns it together with anything else already queued.
+    """
+    def __init__(self, url: str, port: int, secret_token: str = None, host: str = "0.0.0.0"):
+        self.url = url
+        self.port = port
+        self.host = host
+        self.secret_token = secret_token
+        self.path = urlsplit(url).path or "/"
+        self.queue = asyncio.Queue()
+        self._server = None
+
+    async def start(self):
+        bot = get_bot()
+        await bot.initialize()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        await bot.set_webhook(
+            url=self.url,
+            secret_token=self.secret_token,
+            allowed_updates=["message", "callback_query"],
+        )
+        logger.info(f"-> Webhook receiver listening on port {self.port} for {self.url}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status = await self._handle_request(reader)
+        except asyncio.TimeoutError:
+            writer.close()
+            return
+        except (asyncio.IncompleteReadError, ValueError, UnicodeDecodeError) as e:
+            logger.warning(f"-> Malformed webhook request: {e}")
+            status = 400
+        try:
+            writer.write(HTTP_RESPONSES[status])
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _read(self, read):
+        return await asyncio.wait_for(read, timeout=WEBHOOK_READ_TIMEOUT_SECONDS)
+
+    async def _handle_request(self, reader: asyncio.StreamReader) -> int:
+        request_line = (await self._read(reader.readline())).decode("latin-1").split()
+        if len(request_line) < 2:
+            return 400
+        method, path = request_line[0], request_line[1]
+
+        headers = {}
+        while True:
+            line = await self._read(reader.readline())
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if method != "POST" or urlsplit(path).path != self.path:
+            return 404
+        if self.secret_token and headers.get("x-telegram-bot-api-secret-token") != self.secret_token:
+            return 403
+
+        content_length = int(headers.get("content-length", "0"))
+        if not 0 < content_length <= MAX_WEBHOOK_BODY:
+            return 400
+        body = await self._read(reader.readexactly(content_length))
+
+        update = Update.de_json(json.loads(body), get_bot())
+        if update is None:
+            return 400
+        self.queue.put_nowait(update)
+        return 200
+
+    async def get_pending_updates(self) -> list[dict]:
+        """
+        Waits for the next pushed update and returns it along with any others already queued.
+        """
+        updates = [await self.queue.get()]
+        while not self.queue.empty():
+            updates.append(self.queue.get_nowait())
+        return await parse_updates(get_bot(), updates)
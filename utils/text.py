@@ -0,0 +1,11 @@
+import re
+import unicodedata
+
+def normalize(text: str) -> str:
+    """
+    Lowercases the text, removes accents and punctuation, and collapses whitespace.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"[¿?¡!.;:,]+(?=\s|$)", " ", text)
+    return " ".join(text.split())
@@ -0,0 +1,239 @@
+import json
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextlib
+from collections import deque
+from contextvars import ContextVar
+from utils import config
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = config.TRACING_ENABLED
+HISTOGRAM_WINDOW = 1024
+# Messages slower than this get their spans logged at INFO; the rest at DEBUG.
+SLOW_MESSAGE_SECONDS = config.TRACE_SLOW_MESSAGE_SECONDS
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """
+    Rolling window of the latest durations, plus all-time count, sum and errors.
+    """
+    def __init__(self, kind: str, window: int = HISTOGRAM_WINDOW):
+        self.kind = kind
+        self.window = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def record(self, seconds: float, ok: bool):
+        self.window.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if not ok:
+            self.errors += 1
+
+    def quantiles(self) -> dict:
+        values = sorted(self.window)
+        if not values:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES}
+
+class MessageTrace:
+    """
+    The spans recorded while one message went through the flow.
+    """
+    def __init__(self, shared: dict):
+        self.shared = shared
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name: str, kind: str, started: float, seconds: float, ok: bool):
+        self.spans.append({
+            "name": name, "kind": kind, "ok": ok,
+            "start_ms": round((started - self.started) * 1000, 1),
+            "ms": round(seconds * 1000, 1),
+        })
+
+    def summary(self, seconds: float) -> dict:
+        telegram_input = self.shared.get("telegram_input", {})
+        by_kind = {}
+        for span in self.spans:
+            if span["kind"] != "node":
+                by_kind[span["kind"]] = round(by_kind.get(span["kind"], 0.0) + span["ms"], 1)
+        return {
+            "chat_id": telegram_input.get("chat_id"),
+            "type": telegram_input.get("type"),
+            "intent": self.shared.get("user_intent", {}).get("intent"),
+            "total_ms": round(seconds * 1000, 1),
+            "external_ms": by_kind,
+            "spans": self.spans,
+        }
+
+_current_trace = ContextVar("current_trace", default=None)
+_histograms = {}
+_lock = threading.Lock()
+
+def record(name: str, kind: str, started: float, seconds: float, ok: bool = True):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(kind)
+        histogram.record(seconds, ok)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, kind, started, seconds, ok)
+
+@contextlib.contextmanager
+def span(name: str, kind: str):
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record(name, kind, started, time.perf_counter() - started, ok)
+
+def traced(kind: str, name: str = None):
+    """
+    Decorator that times every call of a function (sync or async) as a span.
+    With tracing disabled the function is returned untouched.
+    """
+    def decorate(function):
+        if not TRACING_ENABLED:
+            return function
+        span_name = name or function.__name__
+
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+NODE_PHASES = ("prep", "exec", "post")
+_traced_node_classes = set()
+
+def trace_nodes(*nodes):
+    """
+    Times prep/exec/post (or their _async versions) of every node's class.
+    Classes are patched once, since the flow copies node instances per run.
+    """
+    if not TRACING_ENABLED:
+        return
+    for node in nodes:
+        cls = type(node)
+        if cls in _traced_node_classes:
+            continue
+        is_async = hasattr(cls, "exec_async")
+        for phase in NODE_PHASES:
+            method_name = f"{phase}_async" if is_async else phase
+            setattr(cls, method_name, traced("node", f"{cls.__name__}.{phase}")(getattr(cls, method_name)))
+        _traced_node_classes.add(cls)
+
+@contextlib.contextmanager
+def message_trace(shared: dict):
+    """
+    Collects the spans of one message. On exit the per-message summary is
+    logged and its total recorded in the per-intent histogram.
+    """
+    if not TRACING_ENABLED:
+        yield
+        return
+    trace = MessageTrace(shared)
+    token = _current_trace.set(trace)
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        _current_trace.reset(token)
+        seconds = time.perf_counter() - trace.started
+        summary = trace.summary(seconds)
+        record(f"message.{summary['intent'] or 'NONE'}", "message", trace.started, seconds, ok)
+        level = logging.INFO if seconds >= SLOW_MESSAGE_SECONDS else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, f"-> Trace: {json.dumps(summary, ensure_ascii=False)}")
+
+def stats() -> dict:
+    """
+    Count, errors, total seconds and rolling p50/p95/p99 per span name.
+    """
+    with _lock:
+        histograms = dict(_histograms)
+    result = {}
+    for name, histogram in sorted(histograms.items()):
+        quantiles = histogram.quantiles()
+        result[name] = {
+            "kind": histogram.kind, "count": histogram.count, "errors": histogram.errors,
+            "p50_ms": round(quantiles[0.5] * 1000, 1),
+            "p95_ms": round(quantiles[0.95] * 1000, 1),
+            "p99_ms": round(quantiles[0.99] * 1000, 1),
+        }
+    return result
+
+def prometheus_text() -> str:
+    """
+    Renders every histogram as a Prometheus summary (rolling quantiles,
+    all-time _sum and _count) plus an error counter.
+    """
+    with _lock:
+        histograms = dict(_histograms)
+    lines = ["# TYPE flux_span_seconds summary"]
+    error_lines = ["# TYPE flux_span_errors_total counter"]
+    for name, histogram in sorted(histograms.items()):
+        labels = f'name="{name}",kind="{histogram.kind}"'
+        for quantile, value in histogram.quantiles().items():
+            lines.append(f'flux_span_seconds{{{labels},quantile="{quantile}"}} {value:.6f}')
+        lines.append(f"flux_span_seconds_sum{{{labels}}} {histogram.total:.6f}")
+        lines.append(f"flux_span_seconds_count{{{labels}}} {histogram.count}")
+        error_lines.append(f"flux_span_errors_total{{{labels}}} {histogram.errors}")
+    return "\n".join(lines + error_lines) + "\n"
+
+class MetricsServer:
+    """
+    Minimal HTTP server answering GET /metrics with prometheus_text().
+    """
+    def __init__(self, port: int, host: str = "0.0.0.0"):
+        self.port = port
+        self.host = host
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"-> Metrics available on port {self.port} at /metrics.")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            while (await asyncio.wait_for(reader.readline(), timeout=10)) not in (b"\r\n", b"\n", b""):
+                pass
+            if request_line.split(b" ")[:2] == [b"GET", b"/metrics"]:
+                body = prometheus_text().encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii")
+                    + body
+                )
+            else:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,194 @@
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import resource
+import statistics
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils import config
+from utils.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_BACKEND = config.TRANSCRIBE_BACKEND
+# "tiny" fits next to the bot on a 256 MB machine; "base" is more accurate but
+# roughly doubles the worker's memory. Measure with the benchmark below.
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "es")
+WHISPER_TIMEOUT_SECONDS = float(os.getenv("WHISPER_TIMEOUT_SECONDS", "60"))
+
+# Lives in the worker process only.
+_worker_model = None
+
+def _load_worker_model(model_name: str, compute_type: str):
+    """
+    Worker initializer: loads the Whisper model once per worker process.
+    """
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(model_name, device="cpu", compute_type=compute_type, cpu_threads=os.cpu_count() or 1)
+
+def _warm_up() -> bool:
+    return _worker_model is not None
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _transcribe_in_worker(audio_bytes: bytes, language: str):
+    """
+    Runs in the worker process. Returns (text, audio duration in seconds).
+    """
+    segments, info = _worker_model.transcribe(io.BytesIO(audio_bytes), language=language, beam_size=1, vad_filter=True)
+    text = " ".join(segment.text.strip() for segment in segments)
+    return text.strip(), info.duration
+
+class WhisperBackend:
+    """
+    Transcribes with a local faster-whisper model in a single worker process,
+    so decoding never competes with the bot for the GIL and the model is kept
+    in memory between voice notes.
+    """
+    def __init__(self, model_name: str = WHISPER_MODEL, compute_type: str = WHISPER_COMPUTE_TYPE,
+                 language: str = WHISPER_LANGUAGE, timeout: float = WHISPER_TIMEOUT_SECONDS):
+        self.model_name = model_name
+        self.language = language
+        self.timeout = timeout
+        # Fork before the bot starts any threads; the worker is reused afterwards.
+        self._executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_load_worker_model,
+            initargs=(model_name, compute_type),
+        )
+        self._ready = self._executor.submit(_warm_up)
+
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        return self._ready.result(timeout=timeout)
+
+    @traced("stt", "whisper.transcribe")
+    def transcribe(self, audio_bytes: bytes) -> str:
+        text, _ = self.transcribe_with_duration(audio_bytes)
+        return text
+
+    def transcribe_with_duration(self, audio_bytes: bytes):
+        future = self._executor.submit(_transcribe_in_worker, audio_bytes, self.language)
+        return future.result(timeout=self.timeout)
+
+    def peak_rss_mb(self) -> float:
+        """
+        Peak resident memory of the worker process, model included.
+        """
+        return self._executor.submit(_peak_rss_mb).result(timeout=self.timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+_whisper = None
+
+def start():
+    """
+    Loads the configured local backend, if any. Call once at startup, before
+    the event loop and worker threads exist.
+    """
+    global _whisper
+    if TRANSCRIBE_BACKEND != "whisper" or _whisper is not None:
+        return
+    if importlib.util.find_spec("faster_whisper") is None:
+        logger.warning("-> TRANSCRIBE_BACKEND=whisper but faster-whisper is not installed. Using Gemini.")
+        return
+
+    logger.info(f"-> Loading local Whisper model '{WHISPER_MODEL}' in a worker process...")
+    started = time.perf_counter()
+    _whisper = WhisperBackend()
+    _whisper._ready.add_done_callback(
+        lambda future: logger.info(
+            f"-> Whisper model ready in {time.perf_counter() - started:.1f}s."
+            if not future.exception() else f"-> Whisper model failed to load: {future.exception()}"
+        )
+    )
+
+def stop():
+    global _whisper
+    if _whisper is not None:
+        _whisper.shutdown()
+        _whisper = None
+
+def transcribe(audio_bytes: bytes, mime_type: str = "audio/ogg") -> str:
+    """
+    Transcribes a voice note with the configured backend, falling back to
+    Gemini if the local model is unavailable, fails or hears nothing.
+    """
+    if _whisper is not None:
+        try:
+            started = time.perf_counter()
+            text = _whisper.transcribe(audio_bytes)
+            logger.info(f"-> Whisper transcription took {time.perf_counter() - started:.2f}s.")
+            if text:
+                return text
+            logger.warning("-> Whisper returned an empty transcription. Falling back to Gemini.")
+        except Exception as e:
+            logger.warning(f"-> Whisper transcription failed ({e}). Falling back to Gemini.")
+
+    from utils.call_llm import transcribe_audio_with_llm
+
+    return transcribe_audio_with_llm(audio_bytes, mime_type)
+
+def benchmark(paths: list, backends: list, runs: int, model_name: str = WHISPER_MODEL):
+    """
+    Times every backend on every file and prints latency, real-time factor
+    and, for Whisper, the peak memory of the worker and of this process.
+    """
+    clips = []
+    for path in paths:
+        with open(path, "rb") as f:
+            clips.append((os.path.basename(path), f.read()))
+
+    for backend in backends:
+        if backend == "whisper":
+            started = time.perf_counter()
+            whisper = WhisperBackend(model_name)
+            whisper.wait_until_ready()
+            print(f"[whisper:{whisper.model_name}] model load: {time.perf_counter() - started:.2f}s")
+            run_one = whisper.transcribe_with_duration
+        else:
+            from utils.call_llm import transcribe_audio_with_llm
+
+            whisper = None
+            run_one = lambda audio_bytes: (transcribe_audio_with_llm(audio_bytes), None)
+
+        for name, audio_bytes in clips:
+            latencies = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                text, duration = run_one(audio_bytes)
+                latencies.append(time.perf_counter() - started)
+            median = statistics.median(latencies)
+            rtf = f", RTF {median / duration:.2f}" if duration else ""
+            print(f"[{backend}] {name}: median {median:.2f}s, max {max(latencies):.2f}s over {runs} runs{rtf}")
+            print(f"    '{text}'")
+
+        if whisper is not None:
+            print(f"[whisper:{whisper.model_name}] peak RSS: worker {whisper.peak_rss_mb():.0f} MB, "
+                  f"main process {_peak_rss_mb():.0f} MB")
+            whisper.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the voice transcription backends.")
+    parser.add_argument("files", nargs="+", help="Voice notes to transcribe (.ogg as sent by Telegram).")
+    parser.add_argument("--backend", choices=["gemini", "whisper", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default=WHISPER_MODEL, help="Whisper model to load (tiny, base, ...).")
+    args = parser.parse_args(argv)
+
+    backends = ["whisper", "gemini"] if args.backend == "both" else [args.backend]
+    benchmark(args.files, backends, args.runs, args.model)
+
+if __name__ == "__main__":
+    sys.exit(main())